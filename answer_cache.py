@@ -0,0 +1,134 @@
+import re
+import time
+
+import numpy as np
+
+from db import (
+    cache_answer,
+    delete_cached_answers,
+    list_cached_answers,
+    prune_cached_answers,
+    touch_cached_answer,
+)
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalize a question for exact-match lookups.
+
+    Lowercases the text, collapses whitespace and strips trailing punctuation.
+
+    Args:
+        question (str): The question as typed by the user.
+
+    Returns:
+        str: The normalized question.
+    """
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip(" ?!.")
+
+
+class AnswerCache:
+    """
+    Cache of generated answers, scoped to a collection.
+
+    Questions are matched exactly after normalization. With `similarity_threshold`
+    set, near-duplicates are also matched by the cosine similarity of their query
+    embeddings; this is off by default because mean-pooled sentence vectors of
+    unrelated questions often score above 0.95. Entries live in the
+    `answer_cache` table of doc_sage.sqlite, expire after `ttl_seconds`, are capped
+    at `max_entries` per collection, and are dropped whenever that chat's sources
+    or collection change.
+
+    Args:
+        embeddings (Embeddings): Model used to embed questions.
+        similarity_threshold (float, optional): Minimum cosine similarity for a
+            near-duplicate hit; None matches exact questions only.
+        ttl_seconds (int): Age after which a cached answer is ignored and pruned.
+        max_entries (int): Maximum number of cached answers kept per collection.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        similarity_threshold: float = None,
+        ttl_seconds: int = 24 * 60 * 60,
+        max_entries: int = 500,
+    ):
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, collection_name: str, question: str):
+        """
+        Find a cached answer for a question.
+
+        Args:
+            collection_name (str): The collection the question is asked against.
+            question (str): The question to look up.
+
+        Returns:
+            str | None: The cached answer, or None on a miss.
+        """
+        rows = list_cached_answers(collection_name, time.time() - self.ttl_seconds)
+        if not rows:
+            self.misses += 1
+            return None
+
+        normalized = normalize_question(question)
+        for answer_id, cached_question, _, answer in rows:
+            if cached_question == normalized:
+                return self._hit(answer_id, answer)
+
+        # Entries stored while semantic matching was off have no embedding
+        rows = [row for row in rows if row[2]]
+        if self.similarity_threshold is not None and rows:
+            query = self._embed(normalized)
+            matrix = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] >= self.similarity_threshold:
+                return self._hit(rows[best][0], rows[best][3])
+
+        self.misses += 1
+        return None
+
+    def _hit(self, answer_id, answer):
+        self.hits += 1
+        touch_cached_answer(answer_id)
+        return answer
+
+    def store(self, collection_name: str, question: str, answer: str):
+        """
+        Cache an answer for a question and enforce the TTL and size limits.
+
+        Args:
+            collection_name (str): The collection the question was asked against.
+            question (str): The question that was answered.
+            answer (str): The generated answer.
+        """
+        normalized = normalize_question(question)
+        embedding = (
+            self._embed(normalized).tobytes() if self.similarity_threshold is not None else b""
+        )
+        cache_answer(collection_name, normalized, embedding, answer)
+        prune_cached_answers(
+            collection_name, time.time() - self.ttl_seconds, self.max_entries
+        )
+
+    def invalidate(self, collection_name: str):
+        """
+        Drop every cached answer for a collection.
+
+        Args:
+            collection_name (str): The collection whose corpus changed.
+        """
+        delete_cached_answers(collection_name)
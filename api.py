@@ -0,0 +1,311 @@
+import argparse
+import asyncio
+import functools
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Query, UploadFile
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+from batch_qa import answer_questions
+from db import (
+    create_chat,
+    create_message,
+    get_messages_page,
+    list_chats_page,
+    list_jobs,
+    list_sources,
+    read_chat,
+    read_job,
+    read_source,
+)
+from jobs import cancel, enqueue_document, enqueue_links
+from metrics import collect, prometheus_text, start_exporter
+from vector_functions import (
+    env,
+    generate_answer_from_context,
+    get_answer_cache,
+    load_retriever,
+    remove_chat,
+    remove_source,
+    stream_answer_from_context,
+    warm_up,
+)
+
+# Blocking work runs on bounded pools so a burst of requests queues up instead of
+# starving the event loop: SQLite calls on one pool, embedding and LLM work on another
+DB_THREADS = env.int("API_DB_THREADS", default=16)
+MODEL_THREADS = env.int("API_MODEL_THREADS", default=4)
+NO_CONTEXT_ANSWER = "I need some context to answer that question."
+
+db_pool = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="api-db")
+model_pool = ThreadPoolExecutor(max_workers=MODEL_THREADS, thread_name_prefix="api-model")
+
+_DONE = object()
+
+
+async def run_db(function, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(
+        db_pool, functools.partial(function, *args, **kwargs)
+    )
+
+
+async def run_model(function, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(
+        model_pool, functools.partial(function, *args, **kwargs)
+    )
+
+
+async def iterate_in_pool(pool, iterable):
+    # Advance a blocking iterator one item at a time on a pool thread
+    loop = asyncio.get_running_loop()
+    iterator = iter(iterable)
+    while True:
+        item = await loop.run_in_executor(pool, next, iterator, _DONE)
+        if item is _DONE:
+            return
+        yield item
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up(background=True)
+    start_exporter()
+    yield
+    db_pool.shutdown(wait=False)
+    model_pool.shutdown(wait=False)
+
+
+app = FastAPI(title="DocSage", lifespan=lifespan)
+
+
+class ChatIn(BaseModel):
+    title: str
+
+
+class LinksIn(BaseModel):
+    urls: list[str]
+
+
+class QuestionIn(BaseModel):
+    question: str
+    stream: bool = True
+
+
+class BatchIn(BaseModel):
+    questions: list[str]
+    # Capped at MODEL_THREADS, which bounds the model calls of the whole process
+    max_concurrency: int = Field(MODEL_THREADS, ge=1)
+
+
+async def require_chat(chat_id: int):
+    chat = await run_db(read_chat, chat_id)
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    return chat
+
+
+def chat_json(chat):
+    return {"id": chat[0], "title": chat[1], "created_at": chat[2], "updated_at": chat[3]}
+
+
+def source_json(source):
+    return {
+        "id": source[0],
+        "name": source[1],
+        "type": source[3],
+        "chat_id": source[4],
+        "content_hash": source[5],
+    }
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return prometheus_text(await run_db(collect))
+
+
+@app.get("/chats")
+async def get_chats(
+    limit: int = 20, after_created_at: Optional[str] = None, after_id: Optional[int] = None
+):
+    after = (after_created_at, after_id) if after_id is not None else None
+    chats = await run_db(list_chats_page, limit, after=after)
+    return [chat_json(chat) for chat in chats]
+
+
+@app.post("/chats", status_code=201)
+async def post_chat(body: ChatIn):
+    chat_id = await run_db(create_chat, body.title)
+    return chat_json(await run_db(read_chat, chat_id))
+
+
+@app.get("/chats/{chat_id}")
+async def get_chat(chat_id: int):
+    return chat_json(await require_chat(chat_id))
+
+
+@app.delete("/chats/{chat_id}", status_code=204)
+async def delete_chat(chat_id: int):
+    await require_chat(chat_id)
+    await run_model(remove_chat, chat_id)
+
+
+@app.get("/chats/{chat_id}/messages")
+async def get_messages(
+    chat_id: int,
+    limit: int = 50,
+    before_timestamp: Optional[str] = None,
+    before_id: Optional[int] = None,
+):
+    await require_chat(chat_id)
+    before = (before_timestamp, before_id) if before_id is not None else None
+    messages = await run_db(get_messages_page, chat_id, limit, before=before)
+    return [
+        {"id": message_id, "sender": sender, "content": content, "timestamp": timestamp}
+        for message_id, sender, content, timestamp in messages
+    ]
+
+
+@app.get("/chats/{chat_id}/sources")
+async def get_sources(chat_id: int, source_type: Optional[str] = Query(None, alias="type")):
+    await require_chat(chat_id)
+    sources = await run_db(list_sources, chat_id, source_type)
+    return [source_json(source) for source in sources]
+
+
+@app.delete("/sources/{source_id}", status_code=204)
+async def delete_source(source_id: int):
+    if not await run_db(read_source, source_id):
+        raise HTTPException(status_code=404, detail="Source not found")
+    await run_model(remove_source, source_id)
+
+
+@app.post("/chats/{chat_id}/uploads", status_code=202)
+async def upload(chat_id: int, file: UploadFile):
+    await require_chat(chat_id)
+    data = await file.read()
+    job_id = await run_db(enqueue_document, chat_id, file.filename, data)
+    return {"job_id": job_id}
+
+
+@app.post("/chats/{chat_id}/links", status_code=202)
+async def add_links(chat_id: int, body: LinksIn):
+    await require_chat(chat_id)
+    return {"job_id": await run_db(enqueue_links, chat_id, body.urls)}
+
+
+@app.get("/chats/{chat_id}/jobs")
+async def get_jobs(chat_id: int, active_only: bool = True):
+    await require_chat(chat_id)
+    return [
+        {
+            "id": job[0],
+            "kind": job[2],
+            "payload": json.loads(job[3]),
+            "status": job[4],
+            "progress": job[5],
+            "error": job[8],
+        }
+        for job in await run_db(list_jobs, chat_id, active_only)
+    ]
+
+
+@app.delete("/jobs/{job_id}", status_code=204)
+async def delete_job(job_id: int):
+    if not await run_db(cancel, job_id):
+        if not await run_db(read_job, job_id):
+            raise HTTPException(status_code=404, detail="Job not found")
+        raise HTTPException(status_code=409, detail="Job already finished")
+
+
+@app.post("/chats/{chat_id}/questions")
+async def ask(chat_id: int, body: QuestionIn):
+    """
+    Answer a question from the chat's sources and save it to the chat history.
+
+    With `stream` (the default) the answer is streamed as plain text while the model
+    generates it; otherwise it is returned as JSON once complete.
+    """
+    await require_chat(chat_id)
+    collection_name = f"chat_{chat_id}"
+    question = body.question
+    # Save the question first so a failed or abandoned answer does not lose it
+    await run_db(create_message, chat_id, "user", question)
+
+    answer = None
+    if not await run_db(list_sources, chat_id):
+        answer = NO_CONTEXT_ANSWER
+    else:
+        answer = await run_model(
+            lambda: get_answer_cache().lookup(collection_name, question)
+        )
+
+    if answer is None and not body.stream:
+        retriever = await run_model(load_retriever, collection_name)
+        answer = await run_model(generate_answer_from_context, retriever, question)
+        await run_model(lambda: get_answer_cache().store(collection_name, question, answer))
+
+    if answer is not None:
+        await run_db(create_message, chat_id, "ai", answer)
+        if body.stream:
+            return PlainTextResponse(answer)
+        return {"answer": answer}
+
+    retriever = await run_model(load_retriever, collection_name)
+
+    async def tokens():
+        parts = []
+        async for token in iterate_in_pool(
+            model_pool, stream_answer_from_context(retriever, question)
+        ):
+            parts.append(token)
+            yield token
+        answer = "".join(parts)
+        await run_model(lambda: get_answer_cache().store(collection_name, question, answer))
+        await run_db(create_message, chat_id, "ai", answer)
+
+    return StreamingResponse(tokens(), media_type="text/plain; charset=utf-8")
+
+
+@app.post("/chats/{chat_id}/questions/batch")
+async def ask_batch(chat_id: int, body: BatchIn):
+    """
+    Answer many questions concurrently, streaming one JSON object per line as each
+    answer finishes. Batch answers are not saved to the chat history.
+    """
+    await require_chat(chat_id)
+
+    async def results():
+        async for result in iterate_in_pool(
+            model_pool,
+            answer_questions(
+                chat_id, body.questions, max_concurrency=min(body.max_concurrency, MODEL_THREADS)
+            ),
+        ):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the DocSage HTTP API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    uvicorn.run("api:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import json
+import sys
+import time
+
+from metrics import span
+from vector_functions import (
+    build_answer_prompt,
+    format_context,
+    get_embeddings,
+    get_llm,
+    load_retriever,
+)
+
+# Questions embedded per forward pass; capped at the query cache size, so each
+# batch's vectors are still cached when it is retrieved
+EMBED_BATCH_SIZE = 256
+
+
+def read_questions(path):
+    """
+    Read questions from a file.
+
+    Args:
+        path (str): A `.jsonl` file of objects with a "question" field, or a text file
+                    with one question per line. Blank lines are ignored.
+
+    Returns:
+        list[str]: The questions, in file order.
+    """
+    with open(path) as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if path.endswith(".jsonl"):
+        return [json.loads(line)["question"] for line in lines]
+    return lines
+
+
+def answer_questions(
+    chat_id,
+    questions,
+    max_concurrency: int = 8,
+    score_threshold: float = 0.6,
+    mode: str = None,
+):
+    """
+    Answer many questions against a chat's sources, yielding results as they finish.
+
+    Questions are embedded in batched forward passes of EMBED_BATCH_SIZE and
+    retrieved against the chat's sources one by one. Then the completions go through
+    the chain's batch path with at most `max_concurrency` model calls in flight.
+
+    Args:
+        chat_id (int): The chat whose sources to answer from.
+        questions (list[str]): The questions.
+        max_concurrency (int): Maximum number of concurrent model calls.
+        score_threshold (float): Minimum similarity of retrieved chunks.
+        mode (str, optional): Retrieval mode, see load_retriever.
+
+    Yields:
+        dict: `index` (position in `questions`), `question`, `answer`, `sources`
+            (content hashes of the chunks used) and `error`, in completion order.
+    """
+    questions = list(questions)
+    if not questions:
+        return
+
+    retriever = load_retriever(f"chat_{chat_id}", score_threshold=score_threshold, mode=mode)
+    embeddings = get_embeddings()
+    batch_size = max(1, min(EMBED_BATCH_SIZE, embeddings.query_cache_size))
+    retrieved = []
+    for start in range(0, len(questions), batch_size):
+        batch = questions[start : start + batch_size]
+        # Fills the query cache, so retrieval embeds nothing itself
+        with span("batch.embed_queries"):
+            embeddings.embed_queries(batch)
+        retrieved.extend(retriever.retrieve_batch(batch))
+
+    inputs = [
+        {"question": question, "context": format_context(documents)}
+        for question, documents in zip(questions, retrieved)
+    ]
+    chain = build_answer_prompt() | get_llm()
+    for index, output in chain.batch_as_completed(
+        inputs, config={"max_concurrency": max_concurrency}, return_exceptions=True
+    ):
+        failed = isinstance(output, Exception)
+        yield {
+            "index": index,
+            "question": questions[index],
+            "answer": None if failed else output.content,
+            "sources": sorted(
+                {
+                    document.metadata.get("content_hash")
+                    for document in retrieved[index]
+                    if document.metadata.get("content_hash")
+                }
+            ),
+            "error": str(output) if failed else None,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Answer a file of questions against a chat's sources."
+    )
+    parser.add_argument("questions", help="Text file (one per line) or .jsonl file")
+    parser.add_argument("--chat-id", type=int, required=True)
+    parser.add_argument("--output", default="-", help="JSONL output file, - for stdout")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--score-threshold", type=float, default=0.6)
+    parser.add_argument("--mode", choices=("hybrid", "similarity"), default=None)
+    args = parser.parse_args()
+
+    questions = read_questions(args.questions)
+    started = time.perf_counter()
+    failed = 0
+    output = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        for result in answer_questions(
+            args.chat_id,
+            questions,
+            max_concurrency=args.concurrency,
+            score_threshold=args.score_threshold,
+            mode=args.mode,
+        ):
+            failed += result["error"] is not None
+            # One line per finished question, so partial results survive a crash
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(
+        f"Answered {len(questions) - failed} of {len(questions)} questions "
+        f"in {time.perf_counter() - started:.1f}s, {failed} failed.",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
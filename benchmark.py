@@ -0,0 +1,305 @@
+"""
+Offline benchmark suite for DocSage.
+
+Runs ingestion, retrieval, end-to-end answering and db.py CRUD benchmarks inside a
+temporary directory, with deterministic stub embeddings and a stub chat model in
+place of the embedding engine and Groq, so no network access or API key is needed.
+Results are written as JSON so runs can be compared.
+
+Usage:
+    python benchmark.py --docs 200 --queries 100 --output results.json
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import platform
+import random
+import re
+import runpy
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class StubEmbeddings(Embeddings):
+    """
+    Deterministic hashing-trick embeddings.
+
+    Each token is hashed into one of `dimensions` buckets, so texts that share words
+    get similar vectors and retrieval behaves plausibly without a real model.
+    """
+
+    def __init__(self, dimensions: int = 384, **kwargs):
+        self.dimensions = dimensions
+
+    def _embed(self, text: str) -> list[float]:
+        vector = [0.0] * self.dimensions
+        for token in re.findall(r"\w+", text.lower()):
+            bucket = int.from_bytes(hashlib.md5(token.encode()).digest()[:4], "little")
+            vector[bucket % self.dimensions] += 1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+class StubChatModel(FakeListChatModel):
+    """Chat model that returns a fixed answer, accepting ChatGroq's constructor args."""
+
+    def __init__(self, **kwargs):
+        super().__init__(
+            responses=["This is a stub answer generated from the provided context."]
+        )
+
+
+def install_stub_models():
+    # Swap the model classes before vector_functions creates its models
+    import embedding_engine
+    import langchain_groq
+
+    embedding_engine.EmbeddingEngine = StubEmbeddings
+    langchain_groq.ChatGroq = StubChatModel
+    os.environ.setdefault("GROQ_API_KEY", "stub")
+
+
+def make_corpus(directory, docs, words_per_doc, seed=0):
+    """
+    Write a synthetic corpus of text files.
+
+    Args:
+        directory (str): Directory to write the files to.
+        docs (int): Number of documents.
+        words_per_doc (int): Approximate number of words per document.
+        seed (int): Random seed, so runs are reproducible.
+
+    Returns:
+        tuple[list[str], list[str]]: The file paths and the vocabulary used.
+    """
+    rng = random.Random(seed)
+    vocabulary = [f"term{i}" for i in range(5000)]
+    paths = []
+    os.makedirs(directory, exist_ok=True)
+    for i in range(docs):
+        words = rng.choices(vocabulary, k=words_per_doc)
+        # Break into lines so the character splitter has separators to work with
+        lines = [" ".join(words[j : j + 12]) for j in range(0, len(words), 12)]
+        path = os.path.join(directory, f"doc_{i:05d}.txt")
+        with open(path, "w") as f:
+            f.write("\n\n".join(lines))
+        paths.append(path)
+    return paths, vocabulary
+
+
+def percentiles(samples):
+    """
+    Summarize latency samples in milliseconds.
+
+    Args:
+        samples (list[float]): Latencies in seconds.
+
+    Returns:
+        dict: Count, mean, p50, p95 and p99 in milliseconds.
+    """
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+    }
+
+
+def bench_ingestion(vector_functions, db, paths):
+    chat_id = db.create_chat("benchmark ingestion")
+    chunks = 0
+    started = time.perf_counter()
+    for path in paths:
+        vector_functions.add_source(chat_id, os.path.basename(path), file_path=path)
+    elapsed = time.perf_counter() - started
+    for source in db.list_sources(chat_id):
+        chunks += len(db.list_document_chunks(source[5]))
+    return chat_id, {
+        "docs": len(paths),
+        "chunks": chunks,
+        "seconds": elapsed,
+        "docs_per_sec": len(paths) / elapsed if elapsed else 0.0,
+        "chunks_per_sec": chunks / elapsed if elapsed else 0.0,
+    }
+
+
+def make_queries(vocabulary, count, seed=1):
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(vocabulary, k=6)) for _ in range(count)]
+
+
+def bench_retrieval(vector_functions, chat_id, queries, score_threshold):
+    collection_name = f"chat_{chat_id}"
+    load_times, search_times, hits = [], [], 0
+    for query in queries:
+        started = time.perf_counter()
+        retriever = vector_functions.load_retriever(collection_name, score_threshold)
+        loaded = time.perf_counter()
+        hits += len(retriever.invoke(query))
+        finished = time.perf_counter()
+        load_times.append(loaded - started)
+        search_times.append(finished - loaded)
+    return {
+        "load_retriever": percentiles(load_times),
+        "similarity_search": percentiles(search_times),
+        "total": percentiles([a + b for a, b in zip(load_times, search_times)]),
+        "mean_results": hits / len(queries) if queries else 0.0,
+    }
+
+
+def bench_answering(vector_functions, chat_id, queries, score_threshold):
+    collection_name = f"chat_{chat_id}"
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        retriever = vector_functions.load_retriever(collection_name, score_threshold)
+        vector_functions.generate_answer_from_context(retriever, query)
+        latencies.append(time.perf_counter() - started)
+    return percentiles(latencies)
+
+
+def bench_db(db, threads, operations):
+    chat_ids = [db.create_chat(f"benchmark crud {i}") for i in range(threads)]
+    latencies = {"create_messages": [], "get_messages": [], "list_sources": []}
+    lock = threading.Lock()
+
+    def worker(chat_id):
+        local = {name: [] for name in latencies}
+        for i in range(operations):
+            started = time.perf_counter()
+            db.create_messages(chat_id, [("user", f"question {i}"), ("ai", f"answer {i}")])
+            local["create_messages"].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            db.get_messages_page(chat_id, 50)
+            local["get_messages"].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            db.list_sources(chat_id)
+            local["list_sources"].append(time.perf_counter() - started)
+        with lock:
+            for name, samples in local.items():
+                latencies[name].extend(samples)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(worker, chat_ids))
+    elapsed = time.perf_counter() - started
+
+    total_ops = threads * operations * len(latencies)
+    return {
+        "threads": threads,
+        "operations": total_ops,
+        "seconds": elapsed,
+        "ops_per_sec": total_ops / elapsed if elapsed else 0.0,
+        "latency": {name: percentiles(samples) for name, samples in latencies.items()},
+    }
+
+
+def run(args):
+    """
+    Run every benchmark in a temporary directory that is removed afterwards.
+
+    Args:
+        args (argparse.Namespace): Parsed command-line options.
+
+    Returns:
+        dict: The benchmark results.
+    """
+    install_stub_models()
+    sys.path.insert(0, REPO_DIR)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="docsage-bench-") as workdir:
+        os.chdir(workdir)
+        try:
+            return _run(args, workdir)
+        finally:
+            os.chdir(cwd)
+
+
+def _run(args, workdir):
+    runpy.run_path(os.path.join(REPO_DIR, "create_relational_db.py"))
+
+    import db
+    import vector_functions
+
+    paths, vocabulary = make_corpus(
+        os.path.join(workdir, "corpus"), args.docs, args.doc_words, seed=args.seed
+    )
+    queries = make_queries(vocabulary, args.queries, seed=args.seed + 1)
+
+    chat_id, ingestion = bench_ingestion(vector_functions, db, paths)
+    retrieval = bench_retrieval(vector_functions, chat_id, queries, args.score_threshold)
+    if not retrieval["mean_results"]:
+        # Otherwise the answer benchmark would only time empty-context prompts
+        raise RuntimeError(
+            "Retrieval returned no context; lower --score-threshold for the stub embeddings"
+        )
+    return {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": vars(args),
+        "ingestion": ingestion,
+        "retrieval": retrieval,
+        "answering": bench_answering(vector_functions, chat_id, queries, args.score_threshold),
+        "db": bench_db(db, args.threads, args.operations),
+        "embedding_cache": vector_functions.get_embeddings().stats(),
+        "startup": vector_functions.startup_report(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline DocSage benchmarks.")
+    parser.add_argument("--docs", type=int, default=50, help="Documents in the corpus")
+    parser.add_argument("--doc-words", type=int, default=2000, help="Words per document")
+    parser.add_argument("--queries", type=int, default=50, help="Queries to time")
+    parser.add_argument("--threads", type=int, default=8, help="Concurrent db threads")
+    parser.add_argument("--operations", type=int, default=100, help="db ops per thread")
+    parser.add_argument("--seed", type=int, default=0)
+    # Hashing-trick vectors of a short query and a long chunk have a low cosine
+    # similarity, so the app's 0.6 default would filter out every result
+    parser.add_argument(
+        "--score-threshold", type=float, default=0.0, help="Retriever score threshold"
+    )
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    # Resolve the output path before run() switches to the temporary directory
+    output = os.path.abspath(args.output) if args.output else None
+    results = json.dumps(run(args), indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(results)
+    else:
+        print(results)
+
+
+if __name__ == "__main__":
+    main()
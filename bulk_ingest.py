@@ -0,0 +1,263 @@
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from db import (
+    add_chunks,
+    add_document_chunks,
+    create_source,
+    find_source,
+    list_document_chunks,
+    transaction,
+)
+from vector_functions import (
+    CORPUS_COLLECTION,
+    SUPPORTED_EXTENSIONS,
+    chunk_id,
+    file_hash,
+    get_answer_cache,
+    get_embeddings,
+    invalidate_collection,
+    iter_parsed_document,
+    iter_split_documents,
+    raw_collection,
+    vector_write,
+)
+
+
+def find_files(paths):
+    """
+    Expand a list of files and directories into the supported files they contain.
+
+    Args:
+        paths (list[str]): File and directory paths. Directories are walked recursively.
+
+    Returns:
+        list[str]: Sorted paths of all files with a supported extension.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(
+                    os.path.join(root, name)
+                    for name in names
+                    if os.path.splitext(name)[1] in SUPPORTED_EXTENSIONS
+                )
+        else:
+            files.append(path)
+    return sorted(files)
+
+
+def _parse_file(file_path):
+    # Runs in a worker process: hash, load and split one file into id/chunk pairs.
+    # Files are already parsed in parallel, so PDFs are not split across processes.
+    content_hash = file_hash(file_path)
+    pages = iter_parsed_document(file_path, content_hash, pdf_workers=1)
+    chunks = {}
+    # Split page by page, so only the chunks are held, not the pages as well
+    for chunk in iter_split_documents(pages):
+        chunk.metadata["content_hash"] = content_hash
+        chunks.setdefault(chunk_id(content_hash, chunk.page_content), chunk)
+    return content_hash, list(chunks.items())
+
+
+def bulk_ingest(
+    collection_name,
+    paths,
+    chat_id=None,
+    max_workers=None,
+    batch_size=512,
+    max_pending=None,
+    progress=None,
+):
+    """
+    Ingest many documents into a collection at once.
+
+    Parsing and splitting run in a process pool while the calling process embeds and
+    upserts the resulting chunks in large batches. At most `max_pending` files are
+    parsed ahead of the embedder, which keeps memory bounded.
+
+    Args:
+        collection_name (str): The collection to add the documents to, normally the
+                               shared corpus.
+        paths (list[str]): Files and/or directories to ingest.
+        chat_id (int, optional): If given, a source row is recorded for each ingested file
+                                 and files the chat already has are skipped. Files
+                                 already in the corpus are attached without embedding.
+        max_workers (int, optional): Number of parser processes. Defaults to the CPU count.
+        batch_size (int): Number of chunks embedded and upserted per batch.
+        max_pending (int, optional): Maximum number of files parsed but not yet indexed.
+                                     Defaults to twice the number of workers.
+        progress (callable, optional): Called as `progress(file_path, status, chunks, error)`
+                                       with status "indexed", "attached", "skipped" or
+                                       "failed" once per file.
+
+    Returns:
+        dict: Summary with the number of files, chunks, failures and elapsed seconds.
+    """
+    started = time.perf_counter()
+    files = find_files(paths)
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * max_workers
+    buffer = []
+    # Files whose chunks are (partly) in the buffer, with their unflushed chunk count
+    buffered_files = []
+    # Content hashes already queued in this run, so duplicate files are indexed once
+    seen_hashes = set()
+    summary = {"files": 0, "chunks": 0, "failed": [], "skipped": []}
+
+    def report(file_path, status, chunks=0, error=None):
+        if progress:
+            progress(file_path, status, chunks, error)
+
+    def flush(limit):
+        while buffer and len(buffer) >= limit:
+            batch = buffer[:batch_size]
+            del buffer[:batch_size]
+            # Embed outside the write lock so the job workers only wait for the upsert
+            embeddings = get_embeddings().embed_documents(
+                [chunk.page_content for _, chunk in batch]
+            )
+            with vector_write():
+                raw_collection(collection_name).upsert(
+                    ids=[cid for cid, _ in batch],
+                    embeddings=embeddings,
+                    documents=[chunk.page_content for _, chunk in batch],
+                    metadatas=[chunk.metadata for _, chunk in batch],
+                )
+                add_chunks(
+                    collection_name,
+                    [
+                        (cid, chunk.metadata["content_hash"], chunk.page_content)
+                        for cid, chunk in batch
+                    ],
+                )
+            summary["chunks"] += len(batch)
+
+            flushed = len(batch)
+            while buffered_files and flushed:
+                entry = buffered_files[0]
+                taken = min(entry[1], flushed)
+                entry[1] -= taken
+                flushed -= taken
+                if entry[1] == 0:
+                    buffered_files.pop(0)
+                    finish(*entry[0])
+
+    def finish(file_path, content_hash, chunk_ids, status="indexed"):
+        with transaction():
+            add_document_chunks(content_hash, chunk_ids)
+            if chat_id is not None:
+                create_source(
+                    os.path.basename(file_path),
+                    "",
+                    chat_id,
+                    source_type="document",
+                    content_hash=content_hash,
+                )
+        summary["files"] += 1
+        report(file_path, status, len(chunk_ids))
+
+    # Spawned workers only import the lightweight loaders, never the models
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        remaining = iter(files)
+        pending = {}
+
+        def submit_next():
+            file_path = next(remaining, None)
+            if file_path is not None:
+                pending[executor.submit(_parse_file, file_path)] = file_path
+
+        for _ in range(max_pending):
+            submit_next()
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_path = pending.pop(future)
+                try:
+                    content_hash, chunks = future.result()
+                except Exception as e:
+                    summary["failed"].append(file_path)
+                    report(file_path, "failed", error=e)
+                else:
+                    if content_hash in seen_hashes or (
+                        chat_id is not None and find_source(chat_id, content_hash)
+                    ):
+                        summary["skipped"].append(file_path)
+                        report(file_path, "skipped")
+                    elif (
+                        chat_id is not None
+                        and collection_name == CORPUS_COLLECTION
+                        and list_document_chunks(content_hash)
+                    ):
+                        # Another chat already added this content to the corpus
+                        seen_hashes.add(content_hash)
+                        finish(file_path, content_hash, [], status="attached")
+                    elif chunks:
+                        seen_hashes.add(content_hash)
+                        buffer.extend(chunks)
+                        chunk_ids = [cid for cid, _ in chunks]
+                        buffered_files.append(
+                            [(file_path, content_hash, chunk_ids), len(chunks)]
+                        )
+                    else:
+                        finish(file_path, content_hash, [])
+                submit_next()
+            flush(batch_size)
+
+    # Write out whatever is left in the last partial batch
+    flush(1)
+    if summary["chunks"]:
+        get_answer_cache().invalidate(collection_name)
+        invalidate_collection(collection_name)
+    if chat_id is not None:
+        invalidate_collection(f"chat_{chat_id}")
+
+    summary["seconds"] = time.perf_counter() - started
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Bulk-ingest a directory or list of documents into the shared corpus."
+    )
+    parser.add_argument("paths", nargs="+", help="Files or directories to ingest")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--chat-id", type=int, help="Chat to attach the documents to")
+    target.add_argument("--collection", help="Collection name to ingest into")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=512)
+    args = parser.parse_args()
+
+    collection_name = args.collection or CORPUS_COLLECTION
+
+    def progress(file_path, status, chunks, error):
+        if error:
+            print(f"[{status}] {file_path}: {error}")
+        else:
+            print(f"[{status}] {file_path} ({chunks} chunks)")
+
+    summary = bulk_ingest(
+        collection_name,
+        args.paths,
+        chat_id=args.chat_id,
+        max_workers=args.workers,
+        batch_size=args.batch_size,
+        progress=progress,
+    )
+    rate = summary["files"] / summary["seconds"] if summary["seconds"] else 0.0
+    print(
+        f"Ingested {summary['files']} files ({summary['chunks']} chunks) in "
+        f"{summary['seconds']:.1f}s ({rate:.2f} files/s), "
+        f"{len(summary['skipped'])} skipped, {len(summary['failed'])} failed."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,35 @@
 import streamlit as st
-import os, time
-import requests
-from bs4 import BeautifulSoup
-from langchain_core.documents import Document
+import os
+import json
 import math
 from db import (
     read_chat,
     create_chat,
-    list_chats,
-    delete_chat,
+    list_chats_page,
+    count_chats,
     create_message,
-    get_messages,
-    create_source,
+    get_messages_after,
+    get_messages_page,
     list_sources,
-    delete_source,
+    list_jobs,
+    count_chunks_by_collection,
+    count_chunks_by_chat,
 )
+from jobs import cancel, enqueue_document, enqueue_links
+from metrics import ENABLED as METRICS_ENABLED
+from metrics import collect, prometheus_text, span, start_exporter, summarize
 from vector_functions import (
-    load_document,
-    create_collection,
     load_retriever,
-    generate_answer_from_context,
-    add_documents_to_collection,
-    load_collection,
+    stream_answer_from_context,
+    remove_source,
+    remove_chat,
+    get_answer_cache,
+    warm_up,
 )
 
+# Number of messages shown when a chat opens, and added by each "Load older" click
+MESSAGES_PER_PAGE = 50
+
 
 def chats_home():
     """
@@ -62,23 +68,22 @@ def chats_home():
     with st.container(border=True):
         st.subheader("Previous Chats")
 
-        # get previous chats from db
-        previous_chats = list_chats()
-
         # Pagination settings
         chats_per_page = 5
-        total_pages = math.ceil(len(previous_chats) / chats_per_page)
+        total_pages = max(math.ceil(count_chats() / chats_per_page), 1)
 
-        # Get current page from session state
-        if "current_page" not in st.session_state:
-            st.session_state.current_page = 1
+        # Keyset cursors: page_cursors[i] is the last chat shown before page i + 1
+        if "page_cursors" not in st.session_state:
+            st.session_state.page_cursors = [None]
+        current_page = len(st.session_state.page_cursors)
 
-        # Calculate start and end indices for the current page
-        start_idx = (st.session_state.current_page - 1) * chats_per_page
-        end_idx = start_idx + chats_per_page
+        # get the chats for the current page from db
+        previous_chats = list_chats_page(
+            chats_per_page, after=st.session_state.page_cursors[-1]
+        )
 
         # Display chats for the current page
-        for chat in previous_chats[start_idx:end_idx]:
+        for chat in previous_chats:
             chat_id, chat_title = chat[0], chat[1]
             with st.container(border=True):
                 col1, col2, col3 = st.columns([0.6, 0.2, 0.2])
@@ -90,50 +95,31 @@ def chats_home():
                         st.rerun()
                 with col3:
                     if st.button("🗑️ Delete", key=f"delete_{chat_id}"):
-                        delete_chat(chat_id)
+                        remove_chat(chat_id)
                         st.success(f"Deleted chat: {chat_title}")
                         st.rerun()
 
         # Pagination controls
         col1, col2, col3 = st.columns([1, 2, 1])
         with col1:
-            if st.button("Previous") and st.session_state.current_page > 1:
-                st.session_state.current_page -= 1
+            if st.button("Previous") and current_page > 1:
+                st.session_state.page_cursors.pop()
                 st.rerun()
         with col2:
-            st.write(f"Page {st.session_state.current_page} of {total_pages}")
+            st.write(f"Page {current_page} of {total_pages}")
         with col3:
-            if st.button("Next") and st.session_state.current_page < total_pages:
-                st.session_state.current_page += 1
+            if st.button("Next") and current_page < total_pages and previous_chats:
+                last_chat = previous_chats[-1]
+                st.session_state.page_cursors.append((last_chat[2], last_chat[0]))
                 st.rerun()
 
 
-def stream_response(response):
-    """
-    Stream a response word by word with a delay between each word.
-
-    Args:
-        response (str): The text response to stream
-
-    Yields:
-        str: Individual words from the response with a space appended
-
-    Note:
-        Adds a 50ms delay between each word to create a typing effect
-    """
-    # Split response into words and stream each one
-    for word in response.split():
-        # Yield the word with a space and pause briefly
-        yield word + " "
-        time.sleep(0.05)
-
-
 def chat_page(chat_id):
     """
     Display the chat page for a specific chat ID.
 
     This function handles displaying and managing an individual chat conversation, including:
-    - Showing the chat history
+    - Showing the most recent messages, with older ones loaded on demand
     - Allowing users to send new messages
     - Streaming AI responses
     - Managing chat context through a vector store retriever
@@ -150,12 +136,84 @@ def chat_page(chat_id):
         st.error("Chat not found")
         return
 
-    # Retrieve messages from DB
-    messages = get_messages(chat_id)
+    with span("page.chat"):
+        _chat_page(chat_id, chat)
+
+
+def load_history(chat_id):
+    """
+    Return the window of messages loaded for a chat in this session.
+
+    The window starts with the newest MESSAGES_PER_PAGE messages and is kept in
+    session state, so later reruns only query messages added since the last one.
+    New messages push the oldest ones out, so a long session does not grow the
+    window past MESSAGES_PER_PAGE plus the pages loaded with "Load older messages".
+
+    Args:
+        chat_id (int): The ID of the chat
+
+    Returns:
+        dict: `messages` as (id, sender, content, timestamp) rows, oldest first,
+            `has_older`, whether older messages exist, and `limit`, the window size.
+    """
+    key = f"history_{chat_id}"
+    history = st.session_state.get(key)
+    if history is None or not history["messages"]:
+        messages = get_messages_page(chat_id, MESSAGES_PER_PAGE)
+        history = {
+            "messages": messages,
+            "has_older": len(messages) == MESSAGES_PER_PAGE,
+            "limit": MESSAGES_PER_PAGE,
+        }
+        st.session_state[key] = history
+    else:
+        newest = history["messages"][-1]
+        history["messages"].extend(get_messages_after(chat_id, (newest[3], newest[0])))
+        overflow = len(history["messages"]) - history["limit"]
+        if overflow > 0:
+            del history["messages"][:overflow]
+            history["has_older"] = True
+    return history
+
+
+def load_older_messages(chat_id):
+    """
+    Prepend the previous page of messages to the chat's loaded window.
+
+    Args:
+        chat_id (int): The ID of the chat
+    """
+    history = st.session_state[f"history_{chat_id}"]
+    oldest = history["messages"][0]
+    older = get_messages_page(chat_id, MESSAGES_PER_PAGE, before=(oldest[3], oldest[0]))
+    history["messages"][:0] = older
+    history["has_older"] = len(older) == MESSAGES_PER_PAGE
+    # Keep what the user asked to see when new messages arrive
+    history["limit"] += len(older)
+
+
+@st.fragment
+def message_history(chat_id):
+    """
+    Render the loaded window of a chat's messages.
+
+    As a fragment, loading older messages reruns only the history, not the page.
+
+    Args:
+        chat_id (int): The ID of the chat
+    """
+    history = load_history(chat_id)
+    if history["has_older"]:
+        st.button(
+            "Load older messages",
+            key=f"load_older_{chat_id}",
+            on_click=load_older_messages,
+            args=(chat_id,),
+        )
 
     # Display messages
-    if messages:
-        for sender, content in messages:
+    if history["messages"]:
+        for _, sender, content, _ in history["messages"]:
             if sender == "user":
                 with st.chat_message("user"):
                     st.markdown(content)
@@ -165,36 +223,50 @@ def chat_page(chat_id):
     else:
         st.write("No messages yet. Start the conversation!")
 
+
+def _chat_page(chat_id, chat):
+    message_history(chat_id)
+
     # Add a text input for new messages
     prompt = st.chat_input("Type your message here...")
     if prompt:
 
-        # Save user message
-        create_message(chat_id, "user", prompt)
         # Display user message
         with st.chat_message("user"):
             st.markdown(prompt)
+        # Save it before answering so a failed answer does not lose the question
+        create_message(chat_id, "user", prompt)
         # Get AI response
 
-        # Load retriever for the chat context
-        collection_name = f"chat_{chat_id}"
-        if os.path.exists(f"./persist"):
-            retriever = load_retriever(collection_name=collection_name)
-        else:
-            retriever = None
-
-        # Ask question using the retriever
-        response = (
-            generate_answer_from_context(retriever, prompt)
-            if retriever
-            else "I need some context to answer that question."
-        )
+        with span("page.answer"):
+            # Load retriever for the chat context
+            collection_name = f"chat_{chat_id}"
+            if os.path.exists(f"./persist"):
+                retriever = load_retriever(collection_name=collection_name)
+            else:
+                retriever = None
+
+            # Reuse a cached answer, or stream a new one from the model as it is generated
+            with st.chat_message("assistant"):
+                cached_answer = (
+                    get_answer_cache().lookup(collection_name, prompt)
+                    if retriever
+                    else None
+                )
+                if cached_answer:
+                    response = cached_answer
+                    st.markdown(response)
+                elif retriever:
+                    response = st.write_stream(
+                        stream_answer_from_context(retriever, prompt)
+                    )
+                    get_answer_cache().store(collection_name, prompt, response)
+                else:
+                    response = "I need some context to answer that question."
+                    st.markdown(response)
 
-        # Save AI response
-        create_message(chat_id, "ai", response)
-        # Display AI response
-        with st.chat_message("assistant"):
-            st.write_stream(stream_response(response))
+            # Save the AI response
+            create_message(chat_id, "ai", response)
 
         st.rerun()
 
@@ -220,7 +292,7 @@ def chat_page(chat_id):
                     st.write(doc_name)
                 with col2:
                     if st.button("❌", key=f"delete_doc_{doc_id}"):
-                        delete_source(doc_id)
+                        remove_source(doc_id)
                         st.success(f"Deleted document: {doc_name}")
                         st.rerun()
         else:
@@ -229,31 +301,11 @@ def chat_page(chat_id):
         uploaded_file = st.file_uploader("Upload Document", key="file_uploader")
 
         if uploaded_file:
-            # Save document content to database
-            with st.spinner("Processing document..."):
-                temp_dir = "temp_files"
-                os.makedirs(temp_dir, exist_ok=True)
-                temp_file_path = os.path.join(temp_dir, uploaded_file.name)
-                with open(temp_file_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-
-                # Load document
-                document = load_document(temp_file_path)
-                # Create or update collection for this chat
-                collection_name = f"chat_{chat_id}"
-                if not os.path.exists(f"./persist/{collection_name}"):
-                    vectordb = create_collection(collection_name, document)
-                else:
-                    vectordb = load_collection(collection_name)
-                    vectordb = add_documents_to_collection(vectordb, document)
-                # Save source to database
-                create_source(uploaded_file.name, "", chat_id, source_type="document")
-                # Remove temp file
-                os.remove(temp_file_path)
-
-                del st.session_state["file_uploader"]
-
-                st.rerun()
+            # Queue the document for a background worker instead of blocking the page
+            with span("page.upload"):
+                enqueue_document(chat_id, uploaded_file.name, uploaded_file.getvalue())
+            del st.session_state["file_uploader"]
+            st.rerun()
 
         # Links Section
         st.subheader("🔗 Links")
@@ -268,78 +320,190 @@ def chat_page(chat_id):
                     st.markdown(f"[{link_url}]({link_url})")
                 with col2:
                     if st.button("❌    ", key=f"delete_link_{link_id}"):
-                        delete_source(link_id)
+                        remove_source(link_id)
                         st.success(f"Deleted link: {link_url}")
                         st.rerun()
         else:
             st.write("No links added.")
 
-        # Add new link
-        new_link = st.text_input("Add a link", key="new_link")
-        if st.button("Add Link", key="add_link_btn"):
-            if new_link:
-                with st.spinner("Processing link..."):
-                    # Fetch content from the link
-                    try:
-                        headers = {
-                            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.111 Safari/537.36"
-                        }
-                        response = requests.get(new_link, headers=headers)
-                        soup = BeautifulSoup(response.text, "html.parser")
-
-                        # Check if the content was successfully retrieved
-                        if response.status_code == 200 and soup.text.strip():
-                            link_content = soup.get_text(separator="\n")
-                        else:
-                            st.toast(
-                                "Unable to retrieve content from the link. It may be empty or inaccessible.",
-                                icon="🚨",
-                            )
-                            return
-
-                        # Save link content to vector store
-                        documents = [
-                            Document(
-                                page_content=link_content, metadata={"source": new_link}
-                            )
-                        ]
-                        collection_name = f"chat_{chat_id}"
-                        if not os.path.exists(f"./persist"):
-                            create_collection(collection_name, documents)
-                        else:
-                            vectordb = load_collection(collection_name)
-                            add_documents_to_collection(vectordb, documents)
-
-                        # Save link to database
-                        create_source(new_link, "", chat_id, source_type="link")
-                        st.success(f"Added link: {new_link}")
-                        del st.session_state["add_link_btn"]
-                        st.rerun()
-                    except Exception as e:
-                        st.toast(
-                            f"Failed to fetch content from the link: {e}", icon="⚠️"
-                        )
+        # Add new links, one per line
+        new_links = st.text_area("Add links (one per line)", key="new_link")
+        if st.button("Add Links", key="add_link_btn"):
+            if new_links.strip():
+                enqueue_links(chat_id, new_links.splitlines())
+                st.rerun()
             else:
                 st.toast("Please enter a link", icon="❗")
 
+        job_status(chat_id)
+
+
+@st.fragment(run_every=2)
+def job_status(chat_id):
+    """
+    Show the chat's queued and running ingestion jobs, polling every two seconds.
+
+    Once the last active job finishes the whole page is rerun so the new sources
+    appear in the lists above.
+
+    Args:
+        chat_id (int): The ID of the chat whose jobs to show
+    """
+    jobs = list_jobs(chat_id)
+    state_key = f"active_jobs_{chat_id}"
+    if not jobs:
+        if st.session_state.get(state_key):
+            st.session_state[state_key] = False
+            st.rerun(scope="app")
+        return
+
+    st.session_state[state_key] = True
+    st.subheader("⏳ Processing")
+    for job in jobs:
+        job_id, kind, payload, status, progress = job[0], job[2], job[3], job[4], job[5]
+        label = json.loads(payload)["name"] if kind == "document" else "Links"
+        col1, col2 = st.columns([0.8, 0.2])
+        with col1:
+            st.progress(int(progress), text=f"{label} ({status})")
+        with col2:
+            if st.button("✖", key=f"cancel_job_{job_id}"):
+                cancel(job_id)
+                st.rerun()
+
+
+def admin_page():
+    """
+    Show where time goes: p50/p95 latency per stage across the app and the
+    ingestion workers, cache hit rates, coalesced requests and chunk counts.
+    """
+    st.title("Admin")
+    if st.button("Back to Chats"):
+        st.query_params.clear()
+        st.rerun()
+    if not METRICS_ENABLED:
+        st.info("Tracing is disabled. Unset METRICS_ENABLED=0 to collect timings.")
+
+    snapshot = collect()
+
+    st.subheader("Latency per stage")
+    stages = summarize(snapshot)
+    if stages:
+        st.dataframe(
+            [
+                {
+                    "stage": stage,
+                    "count": stats["count"],
+                    "p50 (ms)": round(stats["p50"] * 1000, 1),
+                    "p95 (ms)": round(stats["p95"] * 1000, 1),
+                    "max (ms)": round(stats["max"] * 1000, 1),
+                }
+                for stage, stats in stages.items()
+            ],
+            hide_index=True,
+        )
+    else:
+        st.write("No samples yet.")
+
+    st.subheader("Caches")
+    gauges = snapshot["gauges"]
+    for col, (label, name) in zip(
+        st.columns(3),
+        (
+            ("Embedding cache", "embedding"),
+            ("Query embedding cache", "embedding_query"),
+            ("Answer cache", "answer"),
+        ),
+    ):
+        hits = gauges.get(f"cache_{name}_hits", 0)
+        misses = gauges.get(f"cache_{name}_misses", 0)
+        with col:
+            st.metric(
+                f"{label} hit rate",
+                f"{hits / (hits + misses):.0%}" if hits + misses else "n/a",
+                help=f"{hits} hits, {misses} misses",
+            )
+
+    st.subheader("Coalesced requests")
+    for col, (label, name) in zip(
+        st.columns(3),
+        (
+            ("Query embeddings", "cache_embedding_query_coalesced"),
+            ("Retrievals", "singleflight_retrieval_coalesced"),
+            ("Answers", "singleflight_answer_coalesced"),
+        ),
+    ):
+        with col:
+            st.metric(
+                label,
+                gauges.get(name, 0),
+                help="Requests that shared another identical request's computation",
+            )
+
+    st.subheader("Chunks")
+    st.dataframe(
+        [
+            {"collection": name, "chunks": count}
+            for name, count in count_chunks_by_collection()
+        ],
+        hide_index=True,
+    )
+    st.dataframe(
+        [
+            {"chat": chat_id, "title": title, "chunks": count}
+            for chat_id, title, count in count_chunks_by_chat()
+        ],
+        hide_index=True,
+    )
+
+    st.download_button(
+        "Download Prometheus metrics",
+        prometheus_text(snapshot),
+        file_name="docsage.prom",
+        mime="text/plain",
+    )
+
+
+@st.cache_resource
+def start_warm_up():
+    """
+    Load the models in a background thread once per server process, so the first
+    question doesn't pay for it and pages that never embed don't wait for it.
+    """
+    return warm_up(background=True)
+
+
+@st.cache_resource
+def start_metrics_exporter():
+    """
+    Export this server's metrics to METRICS_DIR in the background, once per process.
+    """
+    start_exporter()
+
 
 def main():
     """
     Main entry point for the chat application.
 
     Handles routing between the chats list page and individual chat pages:
+    - If `page=admin` is present in URL parameters, displays the metrics page
     - If a chat_id is present in URL parameters, displays that specific chat
     - Otherwise shows the main chats listing page
 
     The function uses Streamlit query parameters to maintain state between page loads
     and determine which view to display.
     """
+    start_warm_up()
+    start_metrics_exporter()
+
     query_params = st.query_params
-    if "chat_id" in query_params:
+    if query_params.get("page") == "admin":
+        admin_page()
+    elif "chat_id" in query_params:
         chat_id = query_params["chat_id"]
         chat_page(chat_id)
     else:
-        chats_home()
+        with span("page.home"):
+            chats_home()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,120 @@
+import logging
+
+import numpy as np
+from langchain_core.documents import Document
+
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens in a piece of text.
+
+    Uses tiktoken's cl100k_base encoding as a close approximation of the chat model's
+    tokenizer, or four characters per token if tiktoken is not installed.
+
+    Args:
+        text (str): The text to count.
+
+    Returns:
+        int: The approximate number of tokens.
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except ImportError:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+def prune_redundant(
+    documents: list[Document], embeddings, threshold: float = None
+) -> list[Document]:
+    """
+    Drop chunks that duplicate a higher-ranked chunk.
+
+    Chunks whose text is identical up to whitespace are always dropped. With
+    `threshold`, documents are also visited in rank order and kept only if their
+    embedding's cosine similarity to every chunk kept so far is below it. Chunk
+    embeddings normally come straight from the embedding cache, since they were
+    computed at ingestion time.
+
+    Args:
+        documents (list[Document]): Retrieved chunks, best first.
+        embeddings (Embeddings): The model used to embed the chunks.
+        threshold (float, optional): Cosine similarity at or above which a chunk is
+            redundant. Semantic pruning is off when not given.
+
+    Returns:
+        list[Document]: The remaining chunks, in their original order.
+    """
+    # Exact duplicates first, which needs no embeddings at all
+    unique = {}
+    for document in documents:
+        unique.setdefault(" ".join(document.page_content.split()), document)
+    documents = list(unique.values())
+    if threshold is None or len(documents) < 2:
+        return documents
+
+    vectors = np.asarray(
+        embeddings.embed_documents([document.page_content for document in documents]),
+        dtype=np.float32,
+    )
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+
+    kept = []
+    for i in range(len(documents)):
+        if not kept or float(np.max(vectors[kept] @ vectors[i])) < threshold:
+            kept.append(i)
+    return [documents[i] for i in kept]
+
+
+@timed("assemble_context")
+def assemble_context(
+    documents: list[Document],
+    embeddings,
+    token_budget: int = 2000,
+    redundancy_threshold: float = None,
+) -> str:
+    """
+    Build the prompt context from retrieved chunks within a token budget.
+
+    Duplicate chunks are removed, then chunks are added in score order until the
+    budget is used up; chunks that would overflow it are skipped.
+
+    Args:
+        documents (list[Document]): Retrieved chunks, best first.
+        embeddings (Embeddings): The model used to embed the chunks.
+        token_budget (int): Maximum number of context tokens.
+        redundancy_threshold (float, optional): Cosine similarity at which chunks count
+            as duplicates. Only identical text is removed when not given.
+
+    Returns:
+        str: The context text, chunks separated by blank lines.
+    """
+    selected = []
+    used = 0
+    for document in prune_redundant(documents, embeddings, redundancy_threshold):
+        tokens = count_tokens(document.page_content)
+        if used + tokens > token_budget:
+            continue
+        selected.append(document.page_content)
+        used += tokens
+
+    logger.info(
+        "Context assembled: %d of %d chunks, %d tokens (budget %d)",
+        len(selected),
+        len(documents),
+        used,
+        token_budget,
+    )
+    return "\n\n".join(selected)
@@ -25,11 +25,42 @@ cursor.execute(
         source_text TEXT,
         type TEXT DEFAULT "document",
         chat_id INTEGER,
+        content_hash TEXT,
         FOREIGN KEY (chat_id) REFERENCES chat(id)
     )
 """
 )
 
+# Add columns introduced after the table was first created
+source_columns = [row[1] for row in cursor.execute("PRAGMA table_info(sources)")]
+if "content_hash" not in source_columns:
+    cursor.execute("ALTER TABLE sources ADD COLUMN content_hash TEXT")
+
+# Create 'document_chunks' table mapping a source's content hash to its chunk ids
+cursor.execute(
+    """
+    CREATE TABLE IF NOT EXISTS document_chunks (
+        content_hash TEXT NOT NULL,
+        chunk_id TEXT NOT NULL,
+        PRIMARY KEY (content_hash, chunk_id)
+    )
+"""
+)
+
+# Create 'parsed_documents' table caching the extracted text of every parsed file,
+# keyed by content hash, as zlib-compressed JSON of (text, metadata) pages
+cursor.execute(
+    """
+    CREATE TABLE IF NOT EXISTS parsed_documents (
+        content_hash TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        pages BLOB NOT NULL,
+        page_count INTEGER NOT NULL,
+        text_size INTEGER NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+)
 
 # Create 'messages' table
 cursor.execute(
@@ -45,6 +76,101 @@ cursor.execute(
 """
 )
 
+# Create 'answer_cache' table
+cursor.execute(
+    """
+    CREATE TABLE IF NOT EXISTS answer_cache (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        collection_name TEXT NOT NULL,
+        question TEXT NOT NULL,
+        embedding BLOB NOT NULL,
+        answer TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        last_used REAL NOT NULL
+    );
+"""
+)
+
+# Create 'chunks' table holding the text of every indexed chunk, plus an
+# external-content FTS5 index over it for BM25 lexical search
+cursor.execute(
+    """
+    CREATE TABLE IF NOT EXISTS chunks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        collection_name TEXT NOT NULL,
+        chunk_id TEXT NOT NULL,
+        content_hash TEXT,
+        content TEXT NOT NULL,
+        UNIQUE (collection_name, chunk_id)
+    )
+"""
+)
+cursor.execute(
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+        content, content='chunks', content_rowid='id'
+    )
+"""
+)
+# Keep the FTS index in step with the chunks table
+cursor.execute(
+    """
+    CREATE TRIGGER IF NOT EXISTS chunks_after_insert AFTER INSERT ON chunks BEGIN
+        INSERT INTO chunks_fts(rowid, content) VALUES (new.id, new.content);
+    END
+"""
+)
+cursor.execute(
+    """
+    CREATE TRIGGER IF NOT EXISTS chunks_after_delete AFTER DELETE ON chunks BEGIN
+        INSERT INTO chunks_fts(chunks_fts, rowid, content)
+        VALUES ('delete', old.id, old.content);
+    END
+"""
+)
+
+# Create 'jobs' table used as the background ingestion queue
+cursor.execute(
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT "queued",
+        progress REAL NOT NULL DEFAULT 0,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 3,
+        error TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (chat_id) REFERENCES chat(id)
+    )
+"""
+)
+
+# Create indexes. Re-running this script adds them to an existing database.
+cursor.execute(
+    "CREATE INDEX IF NOT EXISTS idx_messages_chat_timestamp ON messages(chat_id, timestamp)"
+)
+cursor.execute(
+    "CREATE INDEX IF NOT EXISTS idx_sources_chat_type ON sources(chat_id, type)"
+)
+cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_created_at ON chat(created_at)")
+cursor.execute(
+    "CREATE INDEX IF NOT EXISTS idx_sources_content_hash ON sources(content_hash, chat_id)"
+)
+cursor.execute(
+    "CREATE INDEX IF NOT EXISTS idx_chunks_content_hash "
+    "ON chunks(collection_name, content_hash)"
+)
+cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id)")
+cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_chat ON jobs(chat_id, status)")
+cursor.execute(
+    "CREATE INDEX IF NOT EXISTS idx_answer_cache_collection "
+    "ON answer_cache(collection_name, question)"
+)
+
 # Commit the transaction
 conn.commit()
 
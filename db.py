@@ -1,140 +1,658 @@
 import sqlite3
+import threading
+from contextlib import contextmanager
+
+from metrics import timed
+
+DB_PATH = "doc_sage.sqlite"
+
+# One connection per thread, reused across calls
+_local = threading.local()
 
 
 # Connect to SQLite database
 def connect_db():
-    return sqlite3.connect("doc_sage.sqlite")
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.path != DB_PATH:
+        if conn is not None:
+            conn.close()
+        # Autocommit mode: writes are grouped explicitly through transaction()
+        conn = sqlite3.connect(
+            DB_PATH, timeout=30, isolation_level=None, cached_statements=256
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        _local.conn = conn
+        _local.path = DB_PATH
+        _local.depth = 0
+    return conn
+
+
+@contextmanager
+def transaction():
+    """
+    Run a group of writes in a single transaction on this thread's connection.
+
+    Nested uses join the outermost transaction, so CRUD helpers can be combined and
+    committed once, e.g. a user message plus the AI reply.
+
+    Yields:
+        sqlite3.Cursor: A cursor on the shared connection.
+    """
+    conn = connect_db()
+    if _local.depth == 0:
+        conn.execute("BEGIN IMMEDIATE")
+    _local.depth += 1
+    try:
+        yield conn.cursor()
+    except BaseException:
+        _local.depth -= 1
+        if _local.depth == 0:
+            conn.execute("ROLLBACK")
+        raise
+    _local.depth -= 1
+    if _local.depth == 0:
+        conn.execute("COMMIT")
 
 
 # CRUD Operations for 'chat' table
+@timed("db.create_chat")
 def create_chat(title):
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO chat (title) VALUES (?)", (title,))
-    chat_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return chat_id
+    with transaction() as cursor:
+        cursor.execute("INSERT INTO chat (title) VALUES (?)", (title,))
+        return cursor.lastrowid
 
 
 def list_chats():
+    return (
+        connect_db()
+        .execute("SELECT * FROM chat ORDER BY created_at DESC, id DESC")
+        .fetchall()
+    )
+
+
+@timed("db.list_chats_page")
+def list_chats_page(limit, after=None):
+    # Keyset pagination: `after` is the (created_at, id) of the last chat already shown
     conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM chat ORDER BY created_at DESC")
-    chats = cursor.fetchall()
-    conn.close()
-    return chats
+    if after is None:
+        cursor = conn.execute(
+            "SELECT * FROM chat ORDER BY created_at DESC, id DESC LIMIT ?", (limit,)
+        )
+    else:
+        cursor = conn.execute(
+            "SELECT * FROM chat WHERE (created_at, id) < (?, ?) "
+            "ORDER BY created_at DESC, id DESC LIMIT ?",
+            (*after, limit),
+        )
+    return cursor.fetchall()
+
+
+def count_chats():
+    return connect_db().execute("SELECT COUNT(*) FROM chat").fetchone()[0]
 
 
 def read_chat(chat_id):
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM chat WHERE id = ?", (chat_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result
+    return connect_db().execute("SELECT * FROM chat WHERE id = ?", (chat_id,)).fetchone()
 
 
 def update_chat(chat_id, new_title):
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE chat SET title = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-        (new_title, chat_id),
-    )
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute(
+            "UPDATE chat SET title = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (new_title, chat_id),
+        )
 
 
 def delete_chat(chat_id):
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM chat WHERE id = ?", (chat_id,))
-    conn.commit()
-    conn.close()
+    # Remove the chat together with everything that belongs to it
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+        cursor.execute("DELETE FROM sources WHERE chat_id = ?", (chat_id,))
+        delete_cached_answers(f"chat_{chat_id}")
+        cursor.execute("DELETE FROM chat WHERE id = ?", (chat_id,))
 
 
-def create_source(name, source_text, chat_id, source_type="document"):
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO sources (name, source_text, chat_id, type) VALUES (?, ?, ?, ?)",
-        (name, source_text, chat_id, source_type),
-    )
-    conn.commit()
-    conn.close()
+@timed("db.create_source")
+def create_source(name, source_text, chat_id, source_type="document", content_hash=None):
+    with transaction() as cursor:
+        cursor.execute(
+            "INSERT INTO sources (name, source_text, chat_id, type, content_hash) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (name, source_text, chat_id, source_type, content_hash),
+        )
+        # The chat's corpus changed, so its cached answers are stale
+        delete_cached_answers(f"chat_{chat_id}")
+        return cursor.lastrowid
 
 
 def read_source(source_id):
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM sources WHERE id = ?", (source_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result
+    return (
+        connect_db()
+        .execute("SELECT * FROM sources WHERE id = ?", (source_id,))
+        .fetchone()
+    )
 
 
 def update_source(source_id, new_name, new_source_text):
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE sources SET name = ?, source_text = ? WHERE id = ?",
-        (new_name, new_source_text, source_id),
-    )
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute(
+            "UPDATE sources SET name = ?, source_text = ? WHERE id = ?",
+            (new_name, new_source_text, source_id),
+        )
 
 
+@timed("db.list_sources")
 def list_sources(chat_id, source_type=None):
     conn = connect_db()
-    cursor = conn.cursor()
     if source_type:
-        cursor.execute(
+        cursor = conn.execute(
             "SELECT * FROM sources WHERE chat_id = ? AND type = ?",
             (chat_id, source_type),
         )
     else:
-        cursor.execute("SELECT * FROM sources WHERE chat_id = ?", (chat_id,))
-    sources = cursor.fetchall()
-    conn.close()
-    return sources
+        cursor = conn.execute("SELECT * FROM sources WHERE chat_id = ?", (chat_id,))
+    return cursor.fetchall()
 
 
-def delete_source(source_id):
+def find_source(chat_id, content_hash):
+    # Return the chat's source with this content, if it was already added; with no
+    # chat_id, any chat's source with this content
     conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM sources WHERE id = ?", (source_id,))
-    conn.commit()
-    conn.close()
+    if chat_id is None:
+        cursor = conn.execute(
+            "SELECT * FROM sources WHERE content_hash = ? LIMIT 1", (content_hash,)
+        )
+    else:
+        cursor = conn.execute(
+            "SELECT * FROM sources WHERE content_hash = ? AND chat_id = ?",
+            (content_hash, chat_id),
+        )
+    return cursor.fetchone()
+
+
+def list_chats_with_content(content_hash):
+    # Ids of the chats with a source of this content
+    rows = connect_db().execute(
+        "SELECT DISTINCT chat_id FROM sources WHERE content_hash = ?", (content_hash,)
+    )
+    return [row[0] for row in rows]
+
+
+def list_content_hashes():
+    # Every content hash that at least one source refers to
+    rows = connect_db().execute(
+        "SELECT DISTINCT content_hash FROM sources WHERE content_hash IS NOT NULL"
+    )
+    return {row[0] for row in rows}
+
+
+def delete_source(source_id):
+    with transaction() as cursor:
+        cursor.execute(
+            "DELETE FROM answer_cache WHERE collection_name = "
+            "(SELECT 'chat_' || chat_id FROM sources WHERE id = ?)",
+            (source_id,),
+        )
+        cursor.execute("DELETE FROM sources WHERE id = ?", (source_id,))
+
+
+# CRUD Operations for 'document_chunks' table
+@timed("db.add_document_chunks")
+def add_document_chunks(content_hash, chunk_ids):
+    with transaction() as cursor:
+        cursor.executemany(
+            "INSERT OR IGNORE INTO document_chunks (content_hash, chunk_id) VALUES (?, ?)",
+            [(content_hash, chunk_id) for chunk_id in chunk_ids],
+        )
+
+
+def list_document_chunks(content_hash):
+    rows = (
+        connect_db()
+        .execute(
+            "SELECT chunk_id FROM document_chunks WHERE content_hash = ?",
+            (content_hash,),
+        )
+        .fetchall()
+    )
+    return [row[0] for row in rows]
+
+
+def delete_orphan_document_chunks():
+    # Forget chunk mappings for content no source refers to any more
+    with transaction() as cursor:
+        cursor.execute(
+            "DELETE FROM document_chunks WHERE content_hash NOT IN "
+            "(SELECT content_hash FROM sources WHERE content_hash IS NOT NULL)"
+        )
+
+
+def set_document_chunks(content_hash, chunk_ids):
+    # Replace the chunk mapping of a content hash, e.g. after re-chunking
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM document_chunks WHERE content_hash = ?", (content_hash,))
+        add_document_chunks(content_hash, chunk_ids)
+
+
+# CRUD Operations for 'parsed_documents' table
+@timed("db.save_parsed_document")
+def save_parsed_document(content_hash, name, pages, page_count, text_size):
+    # `pages` is the compressed extracted text and page metadata
+    with transaction() as cursor:
+        cursor.execute(
+            "INSERT OR REPLACE INTO parsed_documents "
+            "(content_hash, name, pages, page_count, text_size) VALUES (?, ?, ?, ?, ?)",
+            (content_hash, name, pages, page_count, text_size),
+        )
+
+
+@timed("db.read_parsed_document")
+def read_parsed_document(content_hash):
+    # (name, pages, page_count, text_size), or None if the content was never parsed
+    return (
+        connect_db()
+        .execute(
+            "SELECT name, pages, page_count, text_size FROM parsed_documents "
+            "WHERE content_hash = ?",
+            (content_hash,),
+        )
+        .fetchone()
+    )
+
+
+def has_parsed_document(content_hash):
+    return (
+        connect_db()
+        .execute("SELECT 1 FROM parsed_documents WHERE content_hash = ?", (content_hash,))
+        .fetchone()
+        is not None
+    )
+
+
+def list_parsed_documents():
+    # (content_hash, name, page_count, text_size) of every stored document
+    return (
+        connect_db()
+        .execute(
+            "SELECT content_hash, name, page_count, text_size FROM parsed_documents "
+            "ORDER BY created_at"
+        )
+        .fetchall()
+    )
+
+
+# Queued document jobs for content that was parsed before carry no file, so their
+# stored text must outlive every source until they have run. A running links job
+# records the hash of the page it is adding, whose chunks precede its source
+_ACTIVE_JOB_HASHES = (
+    "SELECT json_extract(payload, '$.content_hash') FROM jobs "
+    "WHERE status IN ('queued', 'running') "
+    "AND json_extract(payload, '$.content_hash') IS NOT NULL"
+)
+
+
+def delete_parsed_document_if_unused(content_hash):
+    with transaction() as cursor:
+        cursor.execute(
+            "DELETE FROM parsed_documents WHERE content_hash = ? AND NOT EXISTS "
+            "(SELECT 1 FROM sources WHERE content_hash = ?) "
+            f"AND content_hash NOT IN ({_ACTIVE_JOB_HASHES})",
+            (content_hash, content_hash),
+        )
+
+
+def delete_unused_parsed_documents():
+    # Forget the text of content no source or pending upload refers to any more;
+    # returns the number of documents deleted
+    with transaction() as cursor:
+        cursor.execute(
+            "DELETE FROM parsed_documents WHERE content_hash NOT IN "
+            "(SELECT content_hash FROM sources WHERE content_hash IS NOT NULL) "
+            f"AND content_hash NOT IN ({_ACTIVE_JOB_HASHES})"
+        )
+        return cursor.rowcount
+
+
+# CRUD Operations for 'chunks' table and its FTS5 index
+@timed("db.add_chunks")
+def add_chunks(collection_name, chunks):
+    # `chunks` are (chunk_id, content_hash, content) tuples; known ids are skipped
+    with transaction() as cursor:
+        cursor.executemany(
+            "INSERT OR IGNORE INTO chunks (collection_name, chunk_id, content_hash, content) "
+            "VALUES (?, ?, ?, ?)",
+            [(collection_name, *chunk) for chunk in chunks],
+        )
+
+
+@timed("db.search_chunks")
+def search_chunks(collection_name, match_query, limit, content_hashes=None):
+    # BM25 search; rows are (chunk_id, content_hash, content, score), best first.
+    # `content_hashes` restricts the search to the chunks of those sources.
+    query = (
+        "SELECT chunks.chunk_id, chunks.content_hash, chunks.content, "
+        "bm25(chunks_fts) AS score "
+        "FROM chunks_fts JOIN chunks ON chunks.id = chunks_fts.rowid "
+        "WHERE chunks_fts MATCH ? AND chunks.collection_name = ? "
+    )
+    params = [match_query, collection_name]
+    if content_hashes is not None:
+        query += f"AND chunks.content_hash IN ({','.join('?' * len(content_hashes))}) "
+        params.extend(content_hashes)
+    query += "ORDER BY score LIMIT ?"
+    params.append(limit)
+    return connect_db().execute(query, params).fetchall()
+
+
+@timed("db.delete_chunks")
+def delete_chunks(collection_name, content_hash=None):
+    # Remove a collection's chunks, or only those of one source's content
+    with transaction() as cursor:
+        if content_hash is None:
+            cursor.execute(
+                "DELETE FROM chunks WHERE collection_name = ?", (collection_name,)
+            )
+        else:
+            cursor.execute(
+                "DELETE FROM chunks WHERE collection_name = ? AND content_hash = ?",
+                (collection_name, content_hash),
+            )
+
+
+def list_chunk_hashes(collection_name):
+    # Every content hash a collection's lexical index has chunks for
+    rows = connect_db().execute(
+        "SELECT DISTINCT content_hash FROM chunks "
+        "WHERE collection_name = ? AND content_hash IS NOT NULL",
+        (collection_name,),
+    )
+    return {row[0] for row in rows}
+
+
+@timed("db.delete_chunk_ids")
+def delete_chunk_ids(collection_name, chunk_ids):
+    # Remove individual chunks, e.g. those a re-chunk no longer produces
+    with transaction() as cursor:
+        cursor.executemany(
+            "DELETE FROM chunks WHERE collection_name = ? AND chunk_id = ?",
+            [(collection_name, chunk_id) for chunk_id in chunk_ids],
+        )
 
 
 # CRUD Operations for 'messages' table
 def create_message(chat_id, sender, content):
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO messages (chat_id, sender, content) VALUES (?, ?, ?)",
-        (chat_id, sender, content),
-    )
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute(
+            "INSERT INTO messages (chat_id, sender, content) VALUES (?, ?, ?)",
+            (chat_id, sender, content),
+        )
+
+
+@timed("db.create_messages")
+def create_messages(chat_id, messages):
+    # Insert several (sender, content) pairs with a single commit
+    with transaction() as cursor:
+        cursor.executemany(
+            "INSERT INTO messages (chat_id, sender, content) VALUES (?, ?, ?)",
+            [(chat_id, sender, content) for sender, content in messages],
+        )
 
 
+@timed("db.get_messages")
 def get_messages(chat_id):
+    return (
+        connect_db()
+        .execute(
+            "SELECT sender, content FROM messages WHERE chat_id = ? "
+            "ORDER BY timestamp ASC, id ASC",
+            (chat_id,),
+        )
+        .fetchall()
+    )
+
+
+@timed("db.get_messages_page")
+def get_messages_page(chat_id, limit, before=None):
+    # Keyset pagination from the newest message backwards. `before` is the
+    # (timestamp, id) of the oldest message already loaded. Rows are returned
+    # oldest first as (id, sender, content, timestamp).
     conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT sender, content FROM messages WHERE chat_id = ? ORDER BY timestamp ASC",
-        (chat_id,),
+    if before is None:
+        cursor = conn.execute(
+            "SELECT id, sender, content, timestamp FROM messages WHERE chat_id = ? "
+            "ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (chat_id, limit),
+        )
+    else:
+        cursor = conn.execute(
+            "SELECT id, sender, content, timestamp FROM messages "
+            "WHERE chat_id = ? AND (timestamp, id) < (?, ?) "
+            "ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (chat_id, *before, limit),
+        )
+    return cursor.fetchall()[::-1]
+
+
+@timed("db.get_messages_after")
+def get_messages_after(chat_id, after):
+    # Messages newer than the (timestamp, id) of the newest message already loaded,
+    # oldest first as (id, sender, content, timestamp)
+    return (
+        connect_db()
+        .execute(
+            "SELECT id, sender, content, timestamp FROM messages "
+            "WHERE chat_id = ? AND (timestamp, id) > (?, ?) "
+            "ORDER BY timestamp ASC, id ASC",
+            (chat_id, *after),
+        )
+        .fetchall()
+    )
+
+
+def count_messages(chat_id):
+    return (
+        connect_db()
+        .execute("SELECT COUNT(*) FROM messages WHERE chat_id = ?", (chat_id,))
+        .fetchone()[0]
     )
-    messages = cursor.fetchall()
-    conn.close()
-    return messages
 
 
 def delete_messages(chat_id):
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+
+
+# CRUD Operations for 'answer_cache' table
+@timed("db.cache_answer")
+def cache_answer(collection_name, question, embedding, answer):
+    with transaction() as cursor:
+        cursor.execute(
+            "INSERT INTO answer_cache "
+            "(collection_name, question, embedding, answer, created_at, last_used) "
+            "VALUES (?, ?, ?, ?, strftime('%s', 'now'), strftime('%s', 'now'))",
+            (collection_name, question, embedding, answer),
+        )
+
+
+@timed("db.list_cached_answers")
+def list_cached_answers(collection_name, created_after):
+    return (
+        connect_db()
+        .execute(
+            "SELECT id, question, embedding, answer FROM answer_cache "
+            "WHERE collection_name = ? AND created_at > ?",
+            (collection_name, created_after),
+        )
+        .fetchall()
+    )
+
+
+def touch_cached_answer(answer_id):
+    with transaction() as cursor:
+        cursor.execute(
+            "UPDATE answer_cache SET last_used = strftime('%s', 'now') WHERE id = ?",
+            (answer_id,),
+        )
+
+
+def prune_cached_answers(collection_name, created_after, max_entries):
+    # Drop expired answers everywhere and keep the newest `max_entries` per collection
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM answer_cache WHERE created_at <= ?", (created_after,))
+        cursor.execute(
+            "DELETE FROM answer_cache WHERE collection_name = ? AND id NOT IN "
+            "(SELECT id FROM answer_cache WHERE collection_name = ? "
+            "ORDER BY last_used DESC LIMIT ?)",
+            (collection_name, collection_name, max_entries),
+        )
+
+
+def delete_cached_answers(collection_name):
+    with transaction() as cursor:
+        cursor.execute(
+            "DELETE FROM answer_cache WHERE collection_name = ?", (collection_name,)
+        )
+
+
+# CRUD Operations for 'jobs' table
+def create_job(chat_id, kind, payload, max_attempts=3):
+    with transaction() as cursor:
+        cursor.execute(
+            "INSERT INTO jobs (chat_id, kind, payload, max_attempts) VALUES (?, ?, ?, ?)",
+            (chat_id, kind, payload, max_attempts),
+        )
+        return cursor.lastrowid
+
+
+def list_active_job_hashes():
+    # Content hashes of jobs that are queued or running; their chunks may already be
+    # in the corpus before the job creates the source
+    return {row[0] for row in connect_db().execute(_ACTIVE_JOB_HASHES)}
+
+
+@timed("db.claim_job")
+def claim_job():
+    # Atomically take the oldest queued job; returns (id, chat_id, kind, payload) or None
+    with transaction() as cursor:
+        job = cursor.execute(
+            "SELECT id, chat_id, kind, payload FROM jobs WHERE status = 'queued' "
+            "ORDER BY id LIMIT 1"
+        ).fetchone()
+        if job:
+            cursor.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, "
+                "progress = 0, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (job[0],),
+            )
+        return job
+
+
+@timed("db.update_job_progress")
+def update_job_progress(job_id, progress):
+    # Returns the job's status so workers notice cancellation
+    with transaction() as cursor:
+        cursor.execute(
+            "UPDATE jobs SET progress = ?, updated_at = CURRENT_TIMESTAMP "
+            "WHERE id = ? AND status = 'running'",
+            (progress, job_id),
+        )
+        return cursor.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+
+
+def set_job_content_hash(job_id, content_hash):
+    # Record the content a running job is about to write, see _ACTIVE_JOB_HASHES
+    with transaction() as cursor:
+        cursor.execute(
+            "UPDATE jobs SET payload = json_set(payload, '$.content_hash', ?) WHERE id = ?",
+            (content_hash, job_id),
+        )
+
+
+def finish_job(job_id, error=None):
+    with transaction() as cursor:
+        cursor.execute(
+            "UPDATE jobs SET status = 'done', progress = 100, error = ?, "
+            "updated_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'running'",
+            (error, job_id),
+        )
+
+
+def fail_job(job_id, error):
+    # Requeue the job until it runs out of attempts; returns the job's new status
+    with transaction() as cursor:
+        cursor.execute(
+            "UPDATE jobs SET error = ?, updated_at = CURRENT_TIMESTAMP, status = "
+            "CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END "
+            "WHERE id = ? AND status = 'running'",
+            (error, job_id),
+        )
+        return cursor.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+
+
+def cancel_job(job_id):
+    # Returns the cancelled job's (status, kind, payload) from before the update, or
+    # None if it does not exist or had already finished
+    with transaction() as cursor:
+        job = cursor.execute(
+            "SELECT status, kind, payload FROM jobs "
+            "WHERE id = ? AND status IN ('queued', 'running')",
+            (job_id,),
+        ).fetchone()
+        if job:
+            cursor.execute(
+                "UPDATE jobs SET status = 'cancelled', updated_at = CURRENT_TIMESTAMP "
+                "WHERE id = ?",
+                (job_id,),
+            )
+        return job
+
+
+def requeue_stale_jobs(stale_seconds):
+    # Put back jobs whose worker died without reporting progress
+    with transaction() as cursor:
+        cursor.execute(
+            "UPDATE jobs SET status = 'queued' WHERE status = 'running' "
+            "AND updated_at < datetime('now', ?)",
+            (f"-{int(stale_seconds)} seconds",),
+        )
+
+
+def read_job(job_id):
+    return connect_db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+def list_jobs(chat_id, active_only=True):
+    if active_only:
+        query = (
+            "SELECT * FROM jobs WHERE chat_id = ? AND status IN ('queued', 'running') "
+            "ORDER BY id"
+        )
+    else:
+        query = "SELECT * FROM jobs WHERE chat_id = ? ORDER BY id DESC"
+    return connect_db().execute(query, (chat_id,)).fetchall()
+
+
+# Statistics for the admin page
+def count_chunks_by_collection():
+    # (collection_name, chunk count) for every collection in the lexical index
+    return (
+        connect_db()
+        .execute("SELECT collection_name, COUNT(*) FROM chunks GROUP BY collection_name")
+        .fetchall()
+    )
+
+
+def count_chunks_by_chat():
+    # (chat_id, chat title, chunk count) over the chat's sources, largest first
+    return (
+        connect_db()
+        .execute(
+            "SELECT chat.id, chat.title, COUNT(DISTINCT document_chunks.chunk_id) AS chunks "
+            "FROM chat JOIN sources ON sources.chat_id = chat.id "
+            "JOIN document_chunks ON document_chunks.content_hash = sources.content_hash "
+            "GROUP BY chat.id ORDER BY chunks DESC"
+        )
+        .fetchall()
+    )
@@ -0,0 +1,291 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+
+from metrics import span
+from singleflight import SingleFlight
+
+# SQLite caps the number of bound parameters per statement; stay well below it.
+_SQL_BATCH_SIZE = 500
+# The row count is re-read after this fraction of max_entries inserts, to catch up
+# with other processes' writes
+_RECOUNT_FRACTION = 0.1
+
+
+def text_hash(text: str) -> str:
+    """
+    Return the hex SHA-256 digest of a piece of text.
+
+    Args:
+        text (str): The text to hash.
+
+    Returns:
+        str: The hex digest of the UTF-8 encoded text.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper backed by a persistent, content-addressed SQLite cache.
+
+    Vectors are keyed by the model name plus a hash of the text, so the same chunk
+    is only ever run through the model once, no matter how many chats or uploads
+    it appears in. The cache is bounded to `max_entries` rows and evicts the least
+    recently used vectors first.
+
+    Query vectors are kept in a separate in-process LRU of `query_cache_size`
+    entries, and concurrent misses for the same query share one model call.
+
+    Args:
+        underlying (Embeddings): The embedding model used for cache misses.
+        model_name (str): Name of the model, part of every cache key.
+        cache_path (str): Path of the SQLite cache file.
+        max_entries (int): Maximum number of vectors kept on disk.
+        query_cache_size (int): Maximum number of query vectors kept in memory.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        model_name: str,
+        cache_path: str = os.path.join("persist", "embedding_cache.sqlite"),
+        max_entries: int = 200_000,
+        query_cache_size: int = 1024,
+    ):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.query_cache_size = query_cache_size
+        self.hits = 0
+        self.misses = 0
+        self.query_hits = 0
+        self.query_misses = 0
+
+        self._queries = OrderedDict()
+        self._query_lock = threading.Lock()
+        self._query_flights = SingleFlight()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        # Job workers share the cache file; wait for each other's writes
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)"
+        )
+        self._conn.commit()
+        self._size = self._count()
+        self._inserts_since_count = 0
+
+    def _count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _key(self, text: str) -> str:
+        return text_hash(f"{self.model_name}\x00{text}")
+
+    def _lookup(self, keys: list[str]) -> dict[str, list[float]]:
+        found = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), _SQL_BATCH_SIZE):
+                batch = keys[start : start + _SQL_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+                if rows:
+                    hit_keys = [key for key, _ in rows]
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_used = ? "
+                        f"WHERE key IN ({','.join('?' * len(hit_keys))})",
+                        [now, *hit_keys],
+                    )
+            self._conn.commit()
+        return found
+
+    def _store(self, items: dict[str, list[float]]):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [
+                    (key, array("f", vector).tobytes(), now)
+                    for key, vector in items.items()
+                ],
+            )
+            self._conn.commit()
+            # Only misses are stored, so the running total is close; it is re-counted
+            # before evicting and now and then to take in other processes' writes
+            self._size += len(items)
+            self._inserts_since_count += len(items)
+            if (
+                self._size > self.max_entries
+                or self._inserts_since_count >= self.max_entries * _RECOUNT_FRACTION
+            ):
+                self._size = self._count()
+                self._inserts_since_count = 0
+                if self._size > self.max_entries:
+                    self._evict()
+
+    def _evict(self):
+        # Drop a little more than the overflow so we don't evict on every insert.
+        excess = self._size - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (excess,),
+        )
+        self._conn.commit()
+        self._size = self._count()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed a list of texts, only running the model on texts not already cached.
+
+        Args:
+            texts (list[str]): The texts to embed.
+
+        Returns:
+            list[list[float]]: One vector per input text, in input order.
+        """
+        keys = [self._key(text) for text in texts]
+        vectors = self._lookup(list(set(keys)))
+
+        # Embed each distinct missing text once, even if it repeats in the batch
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+
+        self.hits += len(texts) - sum(1 for key in keys if key in missing)
+        self.misses += len(missing)
+
+        if missing:
+            with span("embed.documents"):
+                new_vectors = self.underlying.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), new_vectors))
+            self._store(computed)
+            vectors.update(computed)
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> list[float]:
+        """
+        Embed a query, serving repeats from the in-memory query cache.
+
+        Queries are keyed by model and whitespace-normalized text; the normalized
+        text is what gets embedded, so a cached vector is exactly what the model
+        would return.
+
+        Args:
+            text (str): The query text.
+
+        Returns:
+            list[float]: The query vector.
+        """
+        text = " ".join(text.split())
+        key = self._key(text)
+        with self._query_lock:
+            vector = self._queries.get(key)
+            if vector is not None:
+                self._queries.move_to_end(key)
+                self.query_hits += 1
+                return list(vector)
+            self.query_misses += 1
+
+        vector = self._query_flights.do(key, lambda: self._embed_query(key, text))
+        return list(vector)
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed many queries, running the model once for all those not cached.
+
+        The vectors are kept in the in-memory query cache like embed_query's, not in
+        the disk cache meant for chunks, so a later embed_query of the same text is a
+        hit. The misses go through the model's batched document path, which assumes
+        it embeds queries and documents the same way, as EmbeddingEngine does.
+
+        Args:
+            texts (list[str]): The query texts.
+
+        Returns:
+            list[list[float]]: One vector per query, in input order.
+        """
+        texts = [" ".join(text.split()) for text in texts]
+        keys = [self._key(text) for text in texts]
+        vectors = {}
+        missing = {}
+        with self._query_lock:
+            for key, text in zip(keys, texts):
+                vector = self._queries.get(key)
+                if vector is not None:
+                    self._queries.move_to_end(key)
+                    vectors[key] = vector
+                else:
+                    missing.setdefault(key, text)
+            self.query_hits += len(texts) - len(missing)
+            self.query_misses += len(missing)
+
+        if missing:
+            with span("embed.queries"):
+                new_vectors = self.underlying.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), new_vectors))
+            with self._query_lock:
+                for key, vector in computed.items():
+                    self._remember_query(key, vector)
+            vectors.update(computed)
+        return [list(vectors[key]) for key in keys]
+
+    def _embed_query(self, key: str, text: str) -> list[float]:
+        with span("embed.query"):
+            vector = self.underlying.embed_query(text)
+        with self._query_lock:
+            self._remember_query(key, vector)
+        return vector
+
+    def _remember_query(self, key: str, vector: list[float]):
+        # Called with the query lock held
+        self._queries[key] = vector
+        while len(self._queries) > self.query_cache_size:
+            self._queries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """
+        Return cache hit/miss counters and the current number of cached vectors.
+
+        Returns:
+            dict: Keys `hits`, `misses`, `hit_rate` and `entries` for the document
+                cache, and `query_hits`, `query_misses`, `query_coalesced` (misses
+                that shared another request's model call) and `query_entries`.
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self._size,
+            "query_hits": self.query_hits,
+            "query_misses": self.query_misses,
+            "query_coalesced": self._query_flights.coalesced,
+            "query_entries": len(self._queries),
+        }
@@ -0,0 +1,177 @@
+import argparse
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+BACKENDS = ("torch", "int8", "onnx")
+
+
+class EmbeddingEngine(Embeddings):
+    """
+    CPU embedding engine with a choice of inference backend.
+
+    Backends:
+        torch: The sentence-transformers model in fp32, the same vectors as
+               HuggingFaceEmbeddings.
+        int8:  The same model with its Linear layers dynamically quantized to int8.
+        onnx:  The model exported to ONNX and run with ONNX Runtime
+               (needs sentence-transformers>=3.2 and optimum[onnxruntime]).
+
+    Newlines are replaced with spaces before encoding, as HuggingFaceEmbeddings does,
+    so torch vectors match the ones it cached and stored. Texts are sorted by length
+    before batching so each batch pads to a similar length, then returned in input
+    order.
+
+    Args:
+        model_name (str): Hugging Face model name.
+        backend (str): One of BACKENDS.
+        batch_size (int): Number of texts per forward pass.
+        num_threads (int, optional): CPU threads used for inference.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        backend: str = "torch",
+        batch_size: int = 32,
+        num_threads: int = None,
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unsupported embedding backend: {backend}")
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        self.num_threads = num_threads
+        self.model = self._load()
+
+    def _load(self):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+
+        if self.backend == "onnx":
+            model_kwargs = {"provider": "CPUExecutionProvider"}
+            if self.num_threads:
+                import onnxruntime
+
+                session_options = onnxruntime.SessionOptions()
+                session_options.intra_op_num_threads = self.num_threads
+                model_kwargs["session_options"] = session_options
+            return SentenceTransformer(
+                self.model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs
+            )
+
+        model = SentenceTransformer(self.model_name, device="cpu")
+        if self.backend == "int8":
+            model = torch.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        return model
+
+    def _encode(self, texts: list[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        texts = [text.replace("\n", " ") for text in texts]
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start : start + self.batch_size]
+            encoded = self.model.encode(
+                [texts[i] for i in batch],
+                batch_size=len(batch),
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+            for i, vector in zip(batch, encoded):
+                vectors[i] = vector
+        return np.asarray(vectors, dtype=np.float32)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed a list of texts.
+
+        Args:
+            texts (list[str]): The texts to embed.
+
+        Returns:
+            list[list[float]]: One vector per text, in input order.
+        """
+        return self._encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        """
+        Embed a query.
+
+        Args:
+            text (str): The query text.
+
+        Returns:
+            list[float]: The query vector.
+        """
+        return self._encode([text])[0].tolist()
+
+
+def validate_against_baseline(engine: EmbeddingEngine, texts: list[str]) -> dict:
+    """
+    Compare an engine's vectors with the fp32 torch baseline for the same model.
+
+    Args:
+        engine (EmbeddingEngine): The engine to validate.
+        texts (list[str]): Sample texts.
+
+    Returns:
+        dict: Mean and minimum cosine similarity to the baseline vectors, and the
+            time both engines took.
+    """
+    baseline = EmbeddingEngine(
+        engine.model_name, backend="torch", batch_size=engine.batch_size
+    )
+
+    started = time.perf_counter()
+    expected = baseline._encode(texts)
+    baseline_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    actual = engine._encode(texts)
+    engine_seconds = time.perf_counter() - started
+
+    norms = np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1)
+    cosine = np.sum(expected * actual, axis=1) / np.maximum(norms, 1e-12)
+    return {
+        "backend": engine.backend,
+        "texts": len(texts),
+        "mean_cosine": float(cosine.mean()),
+        "min_cosine": float(cosine.min()),
+        "baseline_seconds": baseline_seconds,
+        "engine_seconds": engine_seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Validate an embedding backend against the fp32 baseline."
+    )
+    parser.add_argument("files", nargs="+", help="Text files with one sample per line")
+    parser.add_argument("--model", default="distilbert-base-uncased")
+    parser.add_argument("--backend", choices=BACKENDS, default="int8")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    texts = []
+    for path in args.files:
+        with open(path) as f:
+            texts.extend(line.strip() for line in f if line.strip())
+
+    engine = EmbeddingEngine(
+        args.model, backend=args.backend, batch_size=args.batch_size, num_threads=args.threads
+    )
+    for key, value in validate_against_baseline(engine, texts).items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
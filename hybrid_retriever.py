@@ -0,0 +1,265 @@
+import re
+from typing import Any, Optional
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from db import list_sources, search_chunks
+from metrics import span
+from singleflight import SingleFlight
+
+# Tokens that only make sense as exact lookups: course codes, numbers, identifiers,
+# dotted names and error-string fragments
+_KEYWORD_TOKEN = re.compile(
+    r"\w*\d\w*|\w+_\w+|\w+(?:\.|::)\w+|[A-Z]{2,}\w*|[A-Z]?[a-z]+[A-Z]\w*"
+)
+
+# Leading words that mark a natural-language question, however short
+_QUESTION_WORDS = set(
+    "what who whom whose which when where why how is are was were do does did can "
+    "could should would will explain describe define list tell compare".split()
+)
+
+# Concurrent identical queries against the same chat share one retrieval
+retrieval_flights = SingleFlight()
+
+
+def is_keyword_query(query: str, max_terms: int = 4) -> bool:
+    """
+    Guess whether a query is a keyword lookup rather than a natural-language question.
+
+    Short queries that are quoted, or that contain a code-like token (e.g. "CS101",
+    "KeyError", "np.linalg") and are not phrased as a question, are treated as
+    keyword lookups. "What is DNA" and "DNA?" are questions.
+
+    Args:
+        query (str): The user query.
+        max_terms (int): Queries with more words than this are never keyword lookups.
+
+    Returns:
+        bool: True if the query looks like a keyword lookup.
+    """
+    terms = re.findall(r"\w+", query)
+    if not terms or len(terms) > max_terms:
+        return False
+    query = query.strip()
+    if query.startswith('"'):
+        return True
+    if query.endswith("?") or terms[0].lower() in _QUESTION_WORDS:
+        return False
+    return bool(_KEYWORD_TOKEN.search(query))
+
+
+def to_match_query(query: str, all_terms: bool = False) -> str:
+    """
+    Turn free text into a safe FTS5 MATCH expression.
+
+    Args:
+        query (str): The user query.
+        all_terms (bool): Require every term (AND) instead of any term (OR).
+
+    Returns:
+        str: The MATCH expression, or an empty string if the query has no terms.
+    """
+    terms = [f'"{term}"' for term in re.findall(r"\w+", query)]
+    return (" " if all_terms else " OR ").join(terms)
+
+
+def reciprocal_rank_fusion(rankings: list[list[Document]], k: int = 60) -> list[Document]:
+    """
+    Fuse several ranked result lists with reciprocal-rank fusion.
+
+    Each document scores sum(1 / (k + rank)) over the lists it appears in. Documents
+    are identified by their source content hash and text.
+
+    Args:
+        rankings (list[list[Document]]): Result lists, best first.
+        k (int): The RRF damping constant.
+
+    Returns:
+        list[Document]: The fused ranking, best first.
+    """
+    scores = {}
+    documents = {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking):
+            key = (document.metadata.get("content_hash"), document.page_content)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+            # Keep the first copy seen; dense results carry the full metadata
+            documents.setdefault(key, document)
+    return [documents[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever that fuses dense vector search with BM25 search over the FTS5 index.
+
+    Keyword-looking queries are answered from the lexical index alone when it has
+    matches, skipping the embedding forward pass entirely.
+
+    With `chat_id` set, both searches are restricted to the chunks of that chat's
+    sources, looked up on every query so sources added by other processes are seen.
+    A chat whose `chat_{id}` collection from before the shared corpus has not been
+    migrated yet passes it as `legacy_vectordb`; it is searched too and its results
+    are fused with the corpus results. With `use_lexical` off it is a plain
+    thresholded vector search.
+    """
+
+    vectordb: Any
+    collection_name: str
+    score_threshold: float = 0.6
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+    lexical_fast_path: bool = True
+    use_lexical: bool = True
+    chat_id: Optional[int] = None
+    legacy_vectordb: Any = None
+
+    def content_hashes(self) -> Optional[list[str]]:
+        """
+        Return the content hashes of the chat's sources, or None when unrestricted.
+
+        Returns:
+            list[str] | None: The hashes searches are restricted to.
+        """
+        if self.chat_id is None:
+            return None
+        return [source[5] for source in list_sources(self.chat_id) if source[5]]
+
+    def lexical_search(
+        self, query: str, all_terms: bool = False, content_hashes: list[str] = None
+    ) -> list[Document]:
+        """
+        Search the collection's chunks with BM25.
+
+        Args:
+            query (str): The user query.
+            all_terms (bool): Require every query term to match.
+            content_hashes (list[str], optional): Only search chunks of these sources.
+
+        Returns:
+            list[Document]: Matching chunks, best first.
+        """
+        match_query = to_match_query(query, all_terms=all_terms)
+        if not match_query:
+            return []
+        rankings = []
+        with span("retrieve.lexical"):
+            if content_hashes is None or content_hashes:
+                rankings.append(
+                    search_chunks(
+                        self.collection_name,
+                        match_query,
+                        self.fetch_k,
+                        content_hashes=content_hashes,
+                    )
+                )
+            if self.legacy_vectordb is not None:
+                rankings.append(
+                    search_chunks(f"chat_{self.chat_id}", match_query, self.fetch_k)
+                )
+        return self._fuse(
+            [
+                [
+                    Document(page_content=content, metadata={"content_hash": content_hash})
+                    for _, content_hash, content, _ in rows
+                ]
+                for rows in rankings
+            ]
+        )
+
+    def _fuse(self, rankings: list[list[Document]]) -> list[Document]:
+        # Only a legacy collection gives a second ranking of the same kind
+        if len(rankings) == 1:
+            return rankings[0]
+        return reciprocal_rank_fusion(rankings, self.rrf_k)
+
+    def search_key(self) -> tuple:
+        """
+        Return everything that decides what this retriever returns for a query, so
+        requests are only coalesced with identically configured retrievers.
+
+        Returns:
+            tuple: The collection, chat and search parameters.
+        """
+        return (
+            self.collection_name,
+            self.chat_id,
+            self.legacy_vectordb is not None,
+            self.use_lexical,
+            self.score_threshold,
+            self.k,
+            self.fetch_k,
+            self.rrf_k,
+            self.lexical_fast_path,
+        )
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        key = (*self.search_key(), " ".join(query.split()))
+        documents = retrieval_flights.do(key, lambda: self._timed_retrieve(query))
+        # Followers get their own list so callers can reorder or trim it
+        return list(documents)
+
+    def _timed_retrieve(self, query: str) -> list[Document]:
+        with span("retrieve"):
+            return self._retrieve(query, self.content_hashes())
+
+    def retrieve_batch(self, queries: list[str]) -> list[list[Document]]:
+        """
+        Retrieve chunks for many queries.
+
+        The chat's sources are looked up once for the whole batch. Each query is
+        embedded through the vector store's embeddings, so warm their query cache
+        first (CachedEmbeddings.embed_queries) to embed the batch in one pass.
+
+        Args:
+            queries (list[str]): The user queries.
+
+        Returns:
+            list[list[Document]]: The chunks for each query, best first.
+        """
+        content_hashes = self.content_hashes()
+        results = []
+        for query in queries:
+            with span("retrieve"):
+                results.append(self._retrieve(query, content_hashes))
+        return results
+
+    def _dense_search(self, query, content_hashes):
+        rankings = []
+        if content_hashes is None or content_hashes:
+            search_kwargs = {"k": self.fetch_k}
+            if content_hashes is not None:
+                search_kwargs["filter"] = {"content_hash": {"$in": content_hashes}}
+            rankings.append(self._scored_search(self.vectordb, query, search_kwargs))
+        if self.legacy_vectordb is not None:
+            # Everything in a chat's own collection belongs to the chat
+            rankings.append(
+                self._scored_search(self.legacy_vectordb, query, {"k": self.fetch_k})
+            )
+        return self._fuse(rankings)
+
+    def _scored_search(self, vectordb, query, search_kwargs):
+        scored = vectordb.similarity_search_with_relevance_scores(query, **search_kwargs)
+        return [document for document, score in scored if score >= self.score_threshold]
+
+    def _retrieve(self, query: str, content_hashes: list[str] = None) -> list[Document]:
+        if content_hashes is not None and not content_hashes and self.legacy_vectordb is None:
+            # The chat has no sources yet
+            return []
+
+        if self.use_lexical and self.lexical_fast_path and is_keyword_query(query):
+            lexical = self.lexical_search(query, all_terms=True, content_hashes=content_hashes)
+            if lexical:
+                return lexical[: self.k]
+
+        with span("retrieve.dense"):
+            dense = self._dense_search(query, content_hashes)
+        if not self.use_lexical:
+            return dense[: self.k]
+        lexical = self.lexical_search(query, content_hashes=content_hashes)
+        return reciprocal_rank_fusion([dense, lexical], self.rrf_k)[: self.k]
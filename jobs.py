@@ -0,0 +1,262 @@
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import time
+import uuid
+
+from db import (
+    cancel_job,
+    claim_job,
+    create_job,
+    delete_parsed_document_if_unused,
+    fail_job,
+    finish_job,
+    has_parsed_document,
+    read_chat,
+    requeue_stale_jobs,
+    set_job_content_hash,
+    transaction,
+    update_job_progress,
+)
+from metrics import span, start_exporter
+
+UPLOAD_DIR = "temp_files"
+# Running jobs that have not reported progress for this long are assumed dead
+STALE_JOB_SECONDS = 15 * 60
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when the user cancelled it."""
+
+
+def enqueue_document(chat_id, name, data):
+    """
+    Queue an uploaded document for background ingestion.
+
+    The upload is hashed in memory. Content whose text is already in the parse cache
+    is queued by hash alone, and the queued job keeps that text from being pruned;
+    only new files are written out for the worker to parse.
+
+    Args:
+        chat_id (int): The chat to add the document to.
+        name (str): The original file name.
+        data (bytes): The file contents.
+
+    Returns:
+        int: The id of the queued job.
+    """
+    # The same digest as vector_functions.file_hash, without importing the models
+    content_hash = hashlib.sha256(data).hexdigest()
+    payload = {"name": name, "content_hash": content_hash, "size": len(data)}
+    # Checked and queued in one transaction, so the text cannot be pruned in between
+    with transaction():
+        if has_parsed_document(content_hash):
+            return create_job(chat_id, "document", json.dumps(payload))
+
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    # Keep the extension, which selects the loader, but avoid name clashes
+    file_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}_{name}")
+    with open(file_path, "wb") as f:
+        f.write(data)
+    payload["file_path"] = file_path
+    return create_job(chat_id, "document", json.dumps(payload))
+
+
+def enqueue_links(chat_id, urls):
+    """
+    Queue a list of links for background ingestion.
+
+    Args:
+        chat_id (int): The chat to add the links to.
+        urls (list[str]): The URLs to ingest.
+
+    Returns:
+        int: The id of the queued job.
+    """
+    return create_job(chat_id, "links", json.dumps({"urls": urls}))
+
+
+def cancel(job_id):
+    """
+    Cancel a queued or running job.
+
+    A queued document job's upload is deleted here; a running job notices the
+    cancellation at its next progress report and cleans up after itself.
+
+    Args:
+        job_id (int): The job to cancel.
+
+    Returns:
+        bool: False if the job does not exist or has already finished.
+    """
+    job = cancel_job(job_id)
+    if job is None:
+        return False
+    status, kind, payload = job
+    if status == "queued" and kind == "document":
+        discard_upload(json.loads(payload))
+    return True
+
+
+def discard_upload(payload):
+    """
+    Delete what a document job leaves behind once it will not run again: its
+    spooled upload, and the extracted text it stored if no source uses it.
+
+    Args:
+        payload (dict): The job's decoded payload.
+    """
+    file_path = payload.get("file_path")
+    if not file_path:
+        return
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    if payload.get("content_hash"):
+        delete_parsed_document_if_unused(payload["content_hash"])
+
+
+def _reporter(job_id):
+    def report(percent):
+        if update_job_progress(job_id, min(percent, 99.0)) == "cancelled":
+            raise JobCancelled()
+
+    return report
+
+
+def run_job(job_id, chat_id, kind, payload, pdf_workers=None):
+    """
+    Run one claimed job to completion.
+
+    Args:
+        job_id (int): The job id.
+        chat_id (int): The chat the job belongs to.
+        kind (str): "document" or "links".
+        payload (str): The job's JSON payload.
+        pdf_workers (int, optional): Processes used to extract a large PDF.
+
+    Returns:
+        str | None: A message about partial failures, or None.
+
+    Raises:
+        JobCancelled: If the job was cancelled while running, or its chat was deleted.
+    """
+    with span(f"job.{kind}"):
+        return _run_job(job_id, chat_id, kind, payload, pdf_workers)
+
+
+def _run_job(job_id, chat_id, kind, payload, pdf_workers):
+    # Imported here so the queue helpers can be used without loading any models
+    from link_ingest import ingest_links
+    from vector_functions import CHUNK_SIZE, add_source
+
+    report = _reporter(job_id)
+    payload = json.loads(payload)
+    if read_chat(chat_id) is None:
+        # The chat was deleted after the job was queued
+        cancel_job(job_id)
+        if kind == "document":
+            discard_upload(payload)
+        raise JobCancelled()
+
+    if kind == "document":
+        # Documents already in the parse cache are queued without a file
+        file_path = payload.get("file_path")
+        size = payload.get("size") or os.path.getsize(file_path)
+        # The chunk count is unknown until the file is read, so estimate it from size
+        expected = max(1, math.ceil(size / CHUNK_SIZE))
+        try:
+            add_source(
+                chat_id,
+                payload["name"],
+                file_path=file_path,
+                content_hash=payload.get("content_hash"),
+                progress=lambda chunks: report(100.0 * chunks / expected),
+                pdf_workers=pdf_workers,
+            )
+        except JobCancelled:
+            # add_source already removed the chunks it had written
+            discard_upload(payload)
+            raise
+        if file_path:
+            os.remove(file_path)
+        return None
+
+    if kind == "links":
+        results = ingest_links(
+            chat_id,
+            payload["urls"],
+            progress=lambda done, total: report(100.0 * done / total),
+            # Keeps a concurrent compaction from purging the page before its source exists
+            on_content=lambda content_hash: set_job_content_hash(job_id, content_hash),
+        )
+        failed = [f"{url}: {error}" for url, error in results if error]
+        return "\n".join(failed) or None
+
+    raise ValueError(f"Unknown job kind: {kind}")
+
+
+def run_worker(poll_interval: float = 1.0, once: bool = False, pdf_workers: int = None):
+    """
+    Process queued jobs until interrupted.
+
+    Args:
+        poll_interval (float): Seconds to wait when the queue is empty.
+        once (bool): Stop as soon as the queue is empty.
+        pdf_workers (int, optional): Processes each job may use to extract a large
+                                     PDF, defaults to PDF_WORKERS.
+    """
+    start_exporter()
+    last_requeue = 0.0
+    while True:
+        # Any worker can pick up the jobs of a worker that died, not just a new one
+        if time.monotonic() - last_requeue >= STALE_JOB_SECONDS / 10:
+            requeue_stale_jobs(STALE_JOB_SECONDS)
+            last_requeue = time.monotonic()
+
+        job = claim_job()
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+
+        job_id = job[0]
+        try:
+            error = run_job(*job, pdf_workers=pdf_workers)
+        except JobCancelled:
+            continue
+        except Exception as e:
+            # Out of attempts, or cancelled while failing (e.g. its chat was deleted):
+            # nothing will read the upload again
+            if fail_job(job_id, str(e)) in ("failed", "cancelled") and job[2] == "document":
+                discard_upload(json.loads(job[3]))
+        else:
+            finish_job(job_id, error)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background ingestion workers.")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    # Share the CPUs between the workers' PDF extraction pools instead of giving each
+    # worker a pool as large as the machine
+    pdf_workers = max(1, (os.cpu_count() or 1) // args.workers)
+    # Spawn rather than fork so workers don't inherit this process's SQLite connection
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=run_worker, args=(args.poll_interval, False, pdf_workers))
+        for _ in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    main()
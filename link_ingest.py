@@ -0,0 +1,198 @@
+import asyncio
+import hashlib
+import json
+import os
+
+import httpx
+from bs4 import BeautifulSoup
+from langchain_core.documents import Document
+
+from metrics import span
+from vector_functions import add_source, documents_hash
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/86.0.4240.111 Safari/537.36"
+}
+CACHE_DIR = "http_cache"
+
+
+def _cache_path(cache_dir, url):
+    return os.path.join(cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+
+def _read_cache(cache_dir, url):
+    try:
+        with open(_cache_path(cache_dir, url)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache(cache_dir, url, entry):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _cache_path(cache_dir, url)
+    # Write atomically so concurrent readers never see a partial file
+    with open(path + ".tmp", "w") as f:
+        json.dump(entry, f)
+    os.replace(path + ".tmp", path)
+
+
+def html_to_text(html: str) -> str:
+    """
+    Extract the visible text of an HTML page.
+
+    Uses the lxml parser, falling back to the pure-Python html.parser if lxml is not
+    installed.
+
+    Args:
+        html (str): The page markup.
+
+    Returns:
+        str: The page text, one block per line.
+    """
+    try:
+        soup = BeautifulSoup(html, "lxml")
+    except Exception:
+        soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(["script", "style", "noscript"]):
+        tag.decompose()
+    return soup.get_text(separator="\n").strip()
+
+
+async def _fetch(client, url, max_bytes, cache_dir, timeout):
+    cached = _read_cache(cache_dir, url)
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    async with client.stream("GET", url, headers=headers, timeout=timeout) as response:
+        if response.status_code == 304 and cached:
+            return cached["text"]
+        if response.status_code != 200:
+            raise ValueError(f"HTTP {response.status_code}")
+        if int(response.headers.get("Content-Length") or 0) > max_bytes:
+            raise ValueError(f"Response larger than {max_bytes} bytes")
+
+        body = bytearray()
+        async for block in response.aiter_bytes():
+            body.extend(block)
+            if len(body) > max_bytes:
+                raise ValueError(f"Response larger than {max_bytes} bytes")
+        html = body.decode(response.encoding or "utf-8", errors="replace")
+
+        text = html_to_text(html)
+        if response.headers.get("ETag") or response.headers.get("Last-Modified"):
+            _write_cache(
+                cache_dir,
+                url,
+                {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "text": text,
+                },
+            )
+        return text
+
+
+async def fetch_links(
+    urls,
+    concurrency: int = 8,
+    timeout: float = 15.0,
+    max_bytes: int = 5 * 1024 * 1024,
+    cache_dir: str = CACHE_DIR,
+    client: httpx.AsyncClient = None,
+):
+    """
+    Fetch many URLs concurrently and extract their text.
+
+    Responses are cached on disk and revalidated with ETag/Last-Modified conditional
+    requests, so unchanged pages are not downloaded or parsed again.
+
+    Args:
+        urls (list[str]): The URLs to fetch.
+        concurrency (int): Maximum number of requests in flight.
+        timeout (float): Per-request timeout in seconds, also applied to a given client.
+        max_bytes (int): Responses larger than this are rejected.
+        cache_dir (str): Directory of the response cache.
+        client (httpx.AsyncClient, optional): Client to use, e.g. one pointed at a
+                                              local test server. A pooled client is
+                                              created if not given.
+
+    Returns:
+        list[tuple[str, str | None, Exception | None]]: (url, text, error) per URL,
+                                                        in input order.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    owns_client = client is None
+    if owns_client:
+        client = httpx.AsyncClient(
+            headers=HEADERS,
+            timeout=timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=concurrency),
+        )
+
+    async def fetch_one(url):
+        async with semaphore:
+            try:
+                return url, await _fetch(client, url, max_bytes, cache_dir, timeout), None
+            except Exception as e:
+                return url, None, e
+
+    try:
+        return await asyncio.gather(*(fetch_one(url) for url in urls))
+    finally:
+        if owns_client:
+            await client.aclose()
+
+
+def ingest_links(chat_id, urls, progress=None, on_content=None, **fetch_options):
+    """
+    Fetch a list of links and add each one to a chat as a link source.
+
+    Args:
+        chat_id (int): The chat to add the links to.
+        urls (list[str]): The URLs to ingest. Blank entries and duplicates are ignored.
+        progress (callable, optional): Called as `progress(done, total)` after each link
+                                       has been added or has failed.
+        on_content (callable, optional): Called with each page's content hash before
+                                         its chunks are written.
+        **fetch_options: Passed through to fetch_links.
+
+    Returns:
+        list[tuple[str, str | None]]: (url, error message) per URL; the error is None
+                                      when the link was added.
+    """
+    urls = list(dict.fromkeys(url.strip() for url in urls if url.strip()))
+    results = []
+    with span("fetch_links"):
+        fetched = asyncio.run(fetch_links(urls, **fetch_options))
+    for url, text, error in fetched:
+        if error is not None:
+            results.append((url, str(error)))
+        elif not text:
+            results.append((url, "The page is empty"))
+        else:
+            documents = [Document(page_content=text, metadata={"source": url})]
+            content_hash = documents_hash(documents)
+            # One link failing to embed or store must not abort the others
+            try:
+                if on_content:
+                    on_content(content_hash)
+                add_source(
+                    chat_id,
+                    url,
+                    source_type="link",
+                    documents=documents,
+                    content_hash=content_hash,
+                )
+            except Exception as e:
+                results.append((url, str(e)))
+            else:
+                results.append((url, None))
+        if progress:
+            progress(len(results), len(fetched))
+    return results
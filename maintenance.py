@@ -0,0 +1,145 @@
+import argparse
+
+from db import delete_unused_parsed_documents, list_content_hashes, list_parsed_documents
+from vector_functions import (
+    CORPUS_COLLECTION,
+    compact_collection,
+    corpus_embedding_model,
+    get_embeddings,
+    list_collections,
+    migrate_to_corpus,
+    rechunk_document,
+    reindex_lexical,
+    set_corpus_embedding_model,
+)
+
+
+def chat_collections():
+    """
+    List the names of every per-chat collection left from before the shared corpus.
+
+    Returns:
+        list[str]: The `chat_{id}` collection names.
+    """
+    return [name for name in list_collections() if name.startswith("chat_")]
+
+
+def _add_targets(subparser, corpus=True):
+    target = subparser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--chat-id", type=int)
+    if corpus:
+        target.add_argument("--corpus", action="store_true", help="The shared corpus")
+    target.add_argument("--all", action="store_true")
+
+
+def rechunk(content_hashes=None):
+    """
+    Re-split and re-embed documents from their stored text with the current settings.
+
+    After a change of embedding model only a full rebuild is allowed, since the
+    corpus must not mix vectors of two models; the new model is recorded once
+    every document in use was rebuilt.
+
+    Args:
+        content_hashes (list[str], optional): The documents to rebuild; defaults to
+                                              every stored document a source uses.
+
+    Returns:
+        bool: False if nothing was rebuilt because the embedding model changed.
+    """
+    model = get_embeddings().model_name
+    recorded = corpus_embedding_model()
+    model_changed = recorded is not None and recorded != model
+    if model_changed and content_hashes is not None:
+        print(
+            f"The corpus was embedded with {recorded}, not {model}: "
+            "re-embed every document with `rechunk --all`"
+        )
+        return False
+
+    used = list_content_hashes()
+    if content_hashes is None:
+        content_hashes = [row[0] for row in list_parsed_documents() if row[0] in used]
+    missing = used - set(content_hashes) if model_changed else set()
+    for content_hash in content_hashes:
+        result = rechunk_document(content_hash)
+        if result is None:
+            missing.add(content_hash)
+            print(f"{content_hash}: no stored text, re-upload the file to rebuild it")
+        else:
+            print(f"{content_hash}: added {result['added']}, removed {result['removed']}")
+
+    if model_changed:
+        if missing:
+            print(
+                f"{len(missing)} documents without stored text still have {recorded} "
+                "vectors; re-upload them, then run `rechunk --all` again"
+            )
+        else:
+            set_corpus_embedding_model(model)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance jobs for DocSage data.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    _add_targets(
+        subparsers.add_parser(
+            "compact", help="Rebuild collections without the chunks of deleted sources"
+        )
+    )
+    _add_targets(
+        subparsers.add_parser(
+            "reindex-lexical", help="Rebuild the BM25 chunk index from the vector store"
+        )
+    )
+    _add_targets(
+        subparsers.add_parser(
+            "migrate-corpus", help="Move per-chat collections into the shared corpus"
+        ),
+        corpus=False,
+    )
+    rechunk_parser = subparsers.add_parser(
+        "rechunk",
+        help="Re-split and re-embed documents from their stored text, e.g. after "
+        "changing the chunk size or the embedding model",
+    )
+    target = rechunk_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--content-hash", action="append", dest="content_hashes")
+    target.add_argument("--all", action="store_true")
+    subparsers.add_parser(
+        "prune-parsed", help="Delete the stored text of documents no source uses"
+    )
+    args = parser.parse_args()
+
+    if args.command == "rechunk":
+        if not rechunk(None if args.all else args.content_hashes):
+            raise SystemExit(1)
+        return
+    if args.command == "prune-parsed":
+        print(f"Deleted the text of {delete_unused_parsed_documents()} documents")
+        return
+
+    if getattr(args, "corpus", False):
+        names = [CORPUS_COLLECTION]
+    elif args.all:
+        names = chat_collections()
+        if args.command != "migrate-corpus" and CORPUS_COLLECTION in list_collections():
+            names.append(CORPUS_COLLECTION)
+    else:
+        names = [f"chat_{args.chat_id}"]
+
+    for name in names:
+        if args.command == "compact":
+            result = compact_collection(name)
+            print(f"{name}: kept {result['kept']}, removed {result['removed']}")
+        elif args.command == "reindex-lexical":
+            print(f"{name}: indexed {reindex_lexical(name)} chunks")
+        elif args.command == "migrate-corpus":
+            result = migrate_to_corpus(name)
+            note = "" if result["dropped"] else ", kept the old collection"
+            print(f"{name}: moved {result['moved']}, skipped {result['skipped']}{note}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,715 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import uuid
+from typing import Any, Callable, Iterable, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+MATRIX_DIRECTORY = "matrix"
+# Rows converted to float32 at a time during an exact scan
+SCAN_BLOCK_ROWS = 8192
+
+
+def _matches(value, condition) -> bool:
+    if isinstance(condition, dict):
+        if "$in" in condition:
+            return value in condition["$in"]
+        if "$eq" in condition:
+            return value == condition["$eq"]
+        if "$ne" in condition:
+            return value != condition["$ne"]
+        raise ValueError(f"Unsupported filter: {condition}")
+    return value == condition
+
+
+class MatrixVectorStore(VectorStore):
+    """
+    Vector store that keeps a collection as one float16 matrix in a memory-mapped file.
+
+    Vectors are normalized when added, so a query is scored against every row with a
+    single matrix-vector product and the top-k is exact. Collections larger than
+    `ann_threshold` rows are searched through an in-memory HNSW index instead, built
+    from the matrix on the first query.
+
+    Ids, texts and metadata live in a small SQLite file next to the matrix. Deleted
+    rows leave holes in the matrix until `compact` rewrites it. Every write bumps a
+    revision number, so other processes pick up just the rows that changed on their
+    next query, and add them to the HNSW index instead of rebuilding it.
+
+    Relevance scores are cosine similarities.
+
+    Args:
+        collection_name (str): Name of the collection.
+        embedding_function (Embeddings): Model used to embed texts and queries.
+        persist_directory (str): Directory holding all matrix collections.
+        ann_threshold (int): Row count above which searches use the HNSW index.
+    """
+
+    def __init__(
+        self,
+        collection_name: str,
+        embedding_function: Embeddings,
+        persist_directory: str,
+        ann_threshold: int = 20_000,
+    ):
+        self.name = collection_name
+        self._embedding_function = embedding_function
+        self.directory = os.path.join(persist_directory, MATRIX_DIRECTORY, collection_name)
+        self.ann_threshold = ann_threshold
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            os.path.join(self.directory, "rows.sqlite"),
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rows (
+                position INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                document TEXT,
+                metadata TEXT
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value INTEGER)"
+        )
+        # Positions of deleted rows, kept until the next compaction
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS deleted "
+            "(position INTEGER PRIMARY KEY, revision INTEGER NOT NULL)"
+        )
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Collections created before revisions were tracked
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(rows)")]
+            if "revision" not in columns:
+                self._conn.execute(
+                    "ALTER TABLE rows ADD COLUMN revision INTEGER NOT NULL DEFAULT 0"
+                )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_rows_revision ON rows (revision)"
+            )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._version = None
+        self._generation = None
+        self._refresh()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding_function
+
+    def _info(self, key: str, default: int = None) -> Optional[int]:
+        row = self._conn.execute("SELECT value FROM info WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_info(self, key: str, value: int):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    def _matrix_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"vectors-{generation}.f16")
+
+    def _refresh(self):
+        # data_version changes whenever another connection commits
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._version:
+            self._load()
+            self._version = version
+
+    def _load(self):
+        # Read the changes, or everything after a compaction, from one snapshot
+        owns_transaction = not self._conn.in_transaction
+        if owns_transaction:
+            self._conn.execute("BEGIN")
+        try:
+            if self._info("generation", 0) != self._generation:
+                self._read_snapshot()
+            else:
+                self._read_changes()
+        finally:
+            if owns_transaction:
+                self._conn.execute("COMMIT")
+
+    def _read_snapshot(self):
+        rows = self._conn.execute(
+            "SELECT position, id, document, metadata FROM rows ORDER BY position"
+        ).fetchall()
+        self._positions = np.array([row[0] for row in rows], dtype=np.int64)
+        self._ids = [row[1] for row in rows]
+        self._documents = [row[2] for row in rows]
+        self._metadatas = [json.loads(row[3]) if row[3] else {} for row in rows]
+        self._index_of = {cid: i for i, cid in enumerate(self._ids)}
+        self._columns = {}
+        self._ann = None
+        self._generation = self._info("generation", 0)
+        self._revision = self._info("revision", 0)
+        self._map_matrix()
+
+    def _read_changes(self):
+        revision = self._info("revision", 0)
+        if revision == self._revision:
+            return
+        deleted = np.array(
+            [
+                row[0]
+                for row in self._conn.execute(
+                    "SELECT position FROM deleted WHERE revision > ?", (self._revision,)
+                )
+            ],
+            dtype=np.int64,
+        )
+        changed = self._conn.execute(
+            "SELECT position, id, document, metadata FROM rows WHERE revision > ? "
+            "ORDER BY position",
+            (self._revision,),
+        ).fetchall()
+        self._revision = revision
+        self._columns = {}
+
+        if len(deleted):
+            remaining = np.flatnonzero(~np.isin(self._positions, deleted))
+            if len(remaining) < len(self._ids):
+                self._positions = self._positions[remaining]
+                self._ids = [self._ids[i] for i in remaining]
+                self._documents = [self._documents[i] for i in remaining]
+                self._metadatas = [self._metadatas[i] for i in remaining]
+                self._index_of = {cid: i for i, cid in enumerate(self._ids)}
+            if self._ann is not None:
+                for position in deleted:
+                    try:
+                        self._ann.mark_deleted(int(position))
+                    except RuntimeError:
+                        # Deleted before it was ever indexed
+                        pass
+
+        if not changed:
+            return
+        # Positions only grow, so rows that are not updates go at the end
+        appended = []
+        for position, cid, document, metadata in changed:
+            metadata = json.loads(metadata) if metadata else {}
+            i = int(np.searchsorted(self._positions, position))
+            if i < len(self._positions) and self._positions[i] == position:
+                self._ids[i], self._documents[i], self._metadatas[i] = cid, document, metadata
+                self._index_of[cid] = i
+            else:
+                self._index_of[cid] = len(self._ids)
+                self._ids.append(cid)
+                self._documents.append(document)
+                self._metadatas.append(metadata)
+                appended.append(position)
+        if appended:
+            self._positions = np.concatenate(
+                [self._positions, np.array(appended, dtype=np.int64)]
+            )
+
+        positions = np.array([row[0] for row in changed], dtype=np.int64)
+        if self._matrix is None or positions[-1] >= len(self._matrix):
+            self._map_matrix()
+        if self._ann is not None:
+            needed = self._ann.get_current_count() + len(appended)
+            if needed > self._ann.get_max_elements():
+                self._ann.resize_index(max(needed, 2 * self._ann.get_max_elements()))
+            # Updated rows may have new vectors, so they are re-added too
+            self._ann.add_items(self._matrix[positions].astype(np.float32), positions)
+
+    def _map_matrix(self):
+        self._dim = self._info("dim")
+        self._matrix = None
+        path = self._matrix_path(self._info("generation", 0))
+        if self._dim and os.path.exists(path) and os.path.getsize(path):
+            self._matrix = np.memmap(
+                path,
+                dtype=np.float16,
+                mode="r",
+                shape=(os.path.getsize(path) // (2 * self._dim), self._dim),
+            )
+
+    def _writable_matrix(self, generation: int, dim: int, rows: int) -> np.memmap:
+        path = self._matrix_path(generation)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        capacity = size // (2 * dim)
+        if capacity < rows:
+            # Grow geometrically so appends don't resize the file every window
+            capacity = max(rows, 2 * capacity, 1024)
+            with open(path, "ab") as f:
+                f.truncate(capacity * dim * 2)
+        return np.memmap(path, dtype=np.float16, mode="r+", shape=(capacity, dim))
+
+    def _column(self, key: str) -> np.ndarray:
+        column = self._columns.get(key)
+        if column is None:
+            column = np.array(
+                [metadata.get(key) for metadata in self._metadatas], dtype=object
+            )
+            self._columns[key] = column
+        return column
+
+    def _filter_mask(self, filter: Optional[dict]) -> Optional[np.ndarray]:
+        if not filter:
+            return None
+        mask = np.ones(len(self._ids), dtype=bool)
+        for key, condition in filter.items():
+            column = self._column(key)
+            if isinstance(condition, dict) and "$in" in condition:
+                mask &= np.isin(column, list(condition["$in"]))
+            else:
+                mask &= np.array([_matches(value, condition) for value in column], dtype=bool)
+        return mask
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        """
+        Embed texts and upsert them; texts with an existing id replace that row.
+
+        Args:
+            texts (Iterable[str]): The texts to add.
+            metadatas (list[dict], optional): Metadata per text.
+            ids (list[str], optional): Ids per text. Random ids are used if not given.
+
+        Returns:
+            list[str]: The ids of the added texts.
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        ids = list(ids) if ids else [uuid.uuid4().hex for _ in texts]
+        self.upsert(
+            ids=ids,
+            embeddings=self._embedding_function.embed_documents(texts),
+            documents=texts,
+            metadatas=metadatas,
+        )
+        return ids
+
+    def upsert(
+        self,
+        ids: list[str],
+        embeddings: list[list[float]],
+        documents: list[str],
+        metadatas: Optional[list[dict]] = None,
+    ):
+        """
+        Insert or replace rows with precomputed vectors, like Chroma's `upsert`.
+
+        Args:
+            ids (list[str]): Row ids.
+            embeddings (list[list[float]]): One vector per row.
+            documents (list[str]): One text per row.
+            metadatas (list[dict], optional): Metadata per row.
+        """
+        texts = list(documents)
+        metadatas = list(metadatas) if metadatas else [{} for _ in texts]
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                dim = self._info("dim")
+                if dim is None:
+                    dim = vectors.shape[1]
+                    self._set_info("dim", dim)
+                elif dim != vectors.shape[1]:
+                    raise ValueError(
+                        f"Collection {self.name} holds {dim}-dimensional vectors, "
+                        f"got {vectors.shape[1]}"
+                    )
+
+                placeholders = ",".join("?" * len(ids))
+                existing = dict(
+                    self._conn.execute(
+                        f"SELECT id, position FROM rows WHERE id IN ({placeholders})", ids
+                    ).fetchall()
+                )
+                revision = self._info("revision", 0) + 1
+                next_position = self._info("next_position", 0)
+                positions = []
+                for cid in ids:
+                    if cid not in existing:
+                        existing[cid] = next_position
+                        next_position += 1
+                    positions.append(existing[cid])
+
+                # Vectors are written before the rows that point at them are committed
+                matrix = self._writable_matrix(self._info("generation", 0), dim, next_position)
+                matrix[positions] = vectors.astype(np.float16)
+                matrix.flush()
+                del matrix
+
+                self._conn.executemany(
+                    """
+                    INSERT INTO rows (position, id, document, metadata, revision)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET
+                        document = excluded.document,
+                        metadata = excluded.metadata,
+                        revision = excluded.revision
+                    """,
+                    [
+                        (position, cid, text, json.dumps(metadata or {}), revision)
+                        for position, cid, text, metadata in zip(
+                            positions, ids, texts, metadatas
+                        )
+                    ],
+                )
+                self._set_info("next_position", next_position)
+                self._set_info("revision", revision)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._load()
+
+    def delete(self, ids: Optional[list[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """
+        Delete rows by id. Their vectors stay in the matrix until `compact`.
+
+        Args:
+            ids (list[str], optional): The ids to delete.
+
+        Returns:
+            bool: True.
+        """
+        if ids:
+            ids = list(ids)
+            placeholders = ",".join("?" * len(ids))
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    revision = self._info("revision", 0) + 1
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO deleted (position, revision) "
+                        f"SELECT position, ? FROM rows WHERE id IN ({placeholders})",
+                        [revision, *ids],
+                    )
+                    self._conn.execute(f"DELETE FROM rows WHERE id IN ({placeholders})", ids)
+                    self._set_info("revision", revision)
+                    self._conn.execute("COMMIT")
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                self._load()
+        return True
+
+    def get(
+        self,
+        ids: Optional[list[str]] = None,
+        where: Optional[dict] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        include: Iterable[str] = ("documents", "metadatas"),
+    ) -> dict:
+        """
+        Read rows, with the same arguments and result shape as Chroma's `get`.
+
+        Args:
+            ids (list[str], optional): Only return these ids.
+            where (dict, optional): Metadata filter.
+            limit (int, optional): Maximum number of rows.
+            offset (int): Number of matching rows to skip.
+            include (Iterable[str]): Any of "documents", "metadatas", "embeddings".
+
+        Returns:
+            dict: "ids" plus one list per included field.
+        """
+        with self._lock:
+            self._refresh()
+            if ids is not None:
+                selected = [self._index_of[cid] for cid in ids if cid in self._index_of]
+            else:
+                selected = range(len(self._ids))
+            mask = self._filter_mask(where)
+            if mask is not None:
+                selected = [i for i in selected if mask[i]]
+            selected = list(selected)[offset:]
+            if limit is not None:
+                selected = selected[:limit]
+
+            result = {"ids": [self._ids[i] for i in selected]}
+            if "documents" in include:
+                result["documents"] = [self._documents[i] for i in selected]
+            if "metadatas" in include:
+                result["metadatas"] = [self._metadatas[i] for i in selected]
+            if "embeddings" in include:
+                result["embeddings"] = (
+                    self._matrix[self._positions[selected]].astype(np.float32).tolist()
+                    if selected
+                    else []
+                )
+            return result
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._ids)
+
+    def _exact_search(self, query: np.ndarray, k: int, mask) -> list[tuple[int, float]]:
+        end = int(self._positions[-1]) + 1
+        scores = np.empty(end, dtype=np.float32)
+        for start in range(0, end, SCAN_BLOCK_ROWS):
+            block = self._matrix[start : min(start + SCAN_BLOCK_ROWS, end)]
+            scores[start : start + len(block)] = block.astype(np.float32) @ query
+        scores = scores[self._positions]
+        if mask is not None:
+            scores[~mask] = -np.inf
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top if scores[i] != -np.inf]
+
+    def _subset_search(
+        self, query: np.ndarray, k: int, rows: np.ndarray
+    ) -> list[tuple[int, float]]:
+        # Scores only the given rows, e.g. one chat's chunks in a large corpus
+        k = min(k, len(rows))
+        if k == 0:
+            return []
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), SCAN_BLOCK_ROWS):
+            block = self._positions[rows[start : start + SCAN_BLOCK_ROWS]]
+            scores[start : start + len(block)] = self._matrix[block].astype(np.float32) @ query
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    def _ann_search(self, query: np.ndarray, k: int, mask) -> list[tuple[int, float]]:
+        if self._ann is None:
+            import hnswlib
+
+            # Labelled by matrix position, which stays put until the next compaction,
+            # so later writes can be applied to the index in place
+            index = hnswlib.Index(space="cosine", dim=self._dim)
+            index.init_index(max_elements=len(self._ids), ef_construction=200, M=16)
+            index.add_items(self._matrix[self._positions].astype(np.float32), self._positions)
+            self._ann = index
+
+        count = len(self._ids) if mask is None else int(mask.sum())
+        k = min(k, count)
+        if k == 0:
+            return []
+        allowed = None
+        if mask is not None:
+            allowed = np.zeros(int(self._positions[-1]) + 1, dtype=bool)
+            allowed[self._positions[mask]] = True
+        self._ann.set_ef(max(50, 2 * k))
+        labels, distances = self._ann.knn_query(
+            query[None, :],
+            k=k,
+            filter=None if allowed is None else (lambda label: bool(allowed[label])),
+        )
+        indices = np.searchsorted(self._positions, labels[0])
+        return [(int(i), 1.0 - float(d)) for i, d in zip(indices, distances[0])]
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: list[float], k: int = 4, filter: Optional[dict] = None
+    ) -> list[tuple[Document, float]]:
+        """
+        Return the k rows most similar to a vector.
+
+        Args:
+            embedding (list[float]): The query vector.
+            k (int): Number of results.
+            filter (dict, optional): Metadata filter, e.g. `{"content_hash": {"$in": [...]}}`.
+
+        Returns:
+            list[tuple[Document, float]]: Documents with their cosine similarity, best first.
+        """
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) + 1e-12
+        with self._lock:
+            self._refresh()
+            if not self._ids or self._matrix is None:
+                return []
+            mask = self._filter_mask(filter)
+            if mask is not None and mask.sum() <= self.ann_threshold:
+                # A small filtered subset is cheaper to scan exactly than to find
+                # through the HNSW index, which checks the filter label by label
+                hits = self._subset_search(query, k, np.flatnonzero(mask))
+            elif len(self._ids) > self.ann_threshold:
+                hits = self._ann_search(query, k, mask)
+            else:
+                hits = self._exact_search(query, k, mask)
+            return [
+                (
+                    Document(
+                        page_content=self._documents[i],
+                        metadata=self._metadatas[i],
+                        id=self._ids[i],
+                    ),
+                    score,
+                )
+                for i, score in hits
+            ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(
+            self._embedding_function.embed_query(query), k=k, filter=filter
+        )
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> list[Document]:
+        return [
+            document
+            for document, _ in self.similarity_search_with_score(query, k, filter=filter)
+        ]
+
+    def similarity_search_by_vector(
+        self, embedding: list[float], k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> list[Document]:
+        return [
+            document
+            for document, _ in self.similarity_search_by_vector_with_score(
+                embedding, k, filter=filter
+            )
+        ]
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self, embedding: list[float], k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        # Same name and raw-score semantics as Chroma's method
+        return self.similarity_search_by_vector_with_score(embedding, k=k, filter=filter)
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # Scores are already cosine similarities
+        return lambda score: score
+
+    def compact(self, keep: Callable[[dict], bool] = None) -> dict:
+        """
+        Rewrite the matrix without deleted rows, and optionally drop more rows.
+
+        The new matrix is written to a new file and swapped in when the rows are
+        committed, so readers never see rows pointing into the wrong file.
+
+        Args:
+            keep (callable, optional): Called with each row's metadata; rows for which
+                                       it returns False are removed.
+
+        Returns:
+            dict: The number of rows kept and removed.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._load()
+                selected = [
+                    i
+                    for i, metadata in enumerate(self._metadatas)
+                    if keep is None or keep(metadata)
+                ]
+                generation = self._info("generation", 0)
+                if selected:
+                    matrix = self._writable_matrix(generation + 1, self._dim, len(selected))
+                    for start in range(0, len(selected), SCAN_BLOCK_ROWS):
+                        block = selected[start : start + SCAN_BLOCK_ROWS]
+                        matrix[start : start + len(block)] = self._matrix[self._positions[block]]
+                    matrix.flush()
+                    del matrix
+
+                self._conn.execute("DELETE FROM rows")
+                self._conn.executemany(
+                    "INSERT INTO rows (position, id, document, metadata) VALUES (?, ?, ?, ?)",
+                    [
+                        (
+                            position,
+                            self._ids[i],
+                            self._documents[i],
+                            json.dumps(self._metadatas[i]),
+                        )
+                        for position, i in enumerate(selected)
+                    ],
+                )
+                self._conn.execute("DELETE FROM deleted")
+                self._set_info("next_position", len(selected))
+                self._set_info("generation", generation + 1)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+            removed = len(self._ids) - len(selected)
+            # Processes that still map the old file keep it alive until they reload
+            old_path = self._matrix_path(generation)
+            self._load()
+            if os.path.exists(old_path):
+                os.remove(old_path)
+        return {"kept": len(selected), "removed": removed}
+
+    def close(self):
+        with self._lock:
+            self._matrix = None
+            self._ann = None
+            self._conn.close()
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+        collection_name: str = "default",
+        persist_directory: str = "./persist",
+        **kwargs: Any,
+    ) -> "MatrixVectorStore":
+        store = cls(collection_name, embedding, persist_directory, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+
+def list_matrix_collections(persist_directory: str) -> list[str]:
+    """
+    List the matrix collections stored in a persist directory.
+
+    Args:
+        persist_directory (str): Directory holding all matrix collections.
+
+    Returns:
+        list[str]: The collection names.
+    """
+    root = os.path.join(persist_directory, MATRIX_DIRECTORY)
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        name for name in os.listdir(root) if os.path.isdir(os.path.join(root, name))
+    )
+
+
+def delete_matrix_collection(persist_directory: str, collection_name: str):
+    """
+    Delete a matrix collection's files. Does nothing if it does not exist.
+
+    Args:
+        persist_directory (str): Directory holding all matrix collections.
+        collection_name (str): The collection to delete.
+    """
+    shutil.rmtree(
+        os.path.join(persist_directory, MATRIX_DIRECTORY, collection_name),
+        ignore_errors=True,
+    )
@@ -0,0 +1,392 @@
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Tracing is on unless METRICS_ENABLED=0; when off, spans and decorators are no-ops
+ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+# Each process writes its snapshot here so the admin page can merge them
+METRICS_DIR = os.environ.get("METRICS_DIR", "metrics")
+# Number of recent samples kept per stage for percentiles
+WINDOW = 2048
+# Exports not rewritten for this many seconds belong to processes that have exited
+STALE_SECONDS = 600.0
+
+_lock = threading.Lock()
+_samples = {}
+# Lifetime (count, total seconds) per stage, for Prometheus' _count and _sum
+_totals = {}
+_counters = {}
+_gauges = {}
+_exporter = None
+
+
+def record(stage: str, seconds: float):
+    """
+    Record one duration for a stage.
+
+    Args:
+        stage (str): Stage name, e.g. "retrieve" or "db.create_messages".
+        seconds (float): How long the stage took.
+    """
+    if not ENABLED:
+        return
+    with _lock:
+        samples = _samples.get(stage)
+        if samples is None:
+            samples = _samples[stage] = deque(maxlen=WINDOW)
+        samples.append(seconds)
+        count, total = _totals.get(stage, (0, 0.0))
+        _totals[stage] = (count + 1, total + seconds)
+
+
+def increment(name: str, value: float = 1):
+    """
+    Add to a counter.
+
+    Args:
+        name (str): Counter name.
+        value (float): Amount to add.
+    """
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def register_gauges(name: str, collect):
+    """
+    Register a callable whose values are read whenever a snapshot is taken.
+
+    Args:
+        name (str): Prefix of the gauges, e.g. "embedding_cache".
+        collect (callable): Returns a dict of numeric values, or None to skip.
+    """
+    _gauges[name] = collect
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Time the enclosed block as one sample of a stage.
+
+    Args:
+        stage (str): Stage name.
+    """
+    if not ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+def timed(stage: str):
+    """
+    Decorator that times every call of a function as a stage.
+
+    When tracing is disabled the function is returned unwrapped.
+
+    Args:
+        stage (str): Stage name.
+    """
+
+    def decorate(function):
+        if not ENABLED:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(stage, time.perf_counter() - started)
+
+        return wrapper
+
+    return decorate
+
+
+def timed_iter(iterable, stage: str):
+    """
+    Yield from an iterable, timing the work done producing its items.
+
+    The total is recorded as one sample of the stage once the iterable is exhausted,
+    so streaming loaders and splitters can be measured without consuming them.
+
+    Args:
+        iterable (Iterable): The iterable to wrap.
+        stage (str): Stage name.
+
+    Yields:
+        The items of `iterable`.
+    """
+    if not ENABLED:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    elapsed = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - started
+            yield item
+    finally:
+        record(stage, elapsed)
+
+
+def snapshot() -> dict:
+    """
+    Return this process's metrics.
+
+    Returns:
+        dict: `samples` (recent durations per stage), `totals` (lifetime count and
+            sum per stage), `counters` and `gauges`.
+    """
+    with _lock:
+        result = {
+            "pid": os.getpid(),
+            "time": time.time(),
+            "samples": {stage: list(samples) for stage, samples in _samples.items()},
+            "totals": {stage: list(total) for stage, total in _totals.items()},
+            "counters": dict(_counters),
+        }
+    gauges = {}
+    for name, collect in list(_gauges.items()):
+        try:
+            values = collect()
+        except Exception:
+            continue
+        for key, value in (values or {}).items():
+            gauges[f"{name}_{key}"] = value
+    result["gauges"] = gauges
+    return result
+
+
+def merge(snapshots: list[dict]) -> dict:
+    """
+    Combine snapshots of several processes into one.
+
+    Args:
+        snapshots (list[dict]): Results of `snapshot`.
+
+    Returns:
+        dict: A snapshot with samples concatenated and totals, counters and gauges
+            summed.
+    """
+    merged = {"samples": {}, "totals": {}, "counters": {}, "gauges": {}}
+    for snap in snapshots:
+        for stage, samples in snap["samples"].items():
+            merged["samples"].setdefault(stage, []).extend(samples)
+        for stage, (count, total) in snap["totals"].items():
+            previous = merged["totals"].get(stage, [0, 0.0])
+            merged["totals"][stage] = [previous[0] + count, previous[1] + total]
+        for kind in ("counters", "gauges"):
+            for name, value in snap[kind].items():
+                merged[kind][name] = merged[kind].get(name, 0) + value
+    return merged
+
+
+def _percentile(ordered: list[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(snap: dict) -> dict:
+    """
+    Compute latency percentiles per stage.
+
+    Args:
+        snap (dict): A snapshot, possibly merged.
+
+    Returns:
+        dict: Per stage, `count` (lifetime), `p50`, `p95` and `max` of the recent
+            samples, in seconds.
+    """
+    summary = {}
+    for stage, samples in sorted(snap["samples"].items()):
+        if not samples:
+            continue
+        ordered = sorted(samples)
+        summary[stage] = {
+            "count": snap["totals"].get(stage, [len(samples)])[0],
+            "p50": _percentile(ordered, 0.5),
+            "p95": _percentile(ordered, 0.95),
+            "max": ordered[-1],
+        }
+    return summary
+
+
+def _metric_name(name: str) -> str:
+    return "".join(c if c.isalnum() else "_" for c in name)
+
+
+def prometheus_text(snap: dict, labels: dict = None) -> str:
+    """
+    Render a snapshot in the Prometheus text exposition format.
+
+    Args:
+        snap (dict): A snapshot, possibly merged.
+        labels (dict, optional): Labels added to every series, e.g. the process id,
+                                 so the files of several processes can be scraped
+                                 together.
+
+    Returns:
+        str: The exposition text.
+    """
+    common = [f'{key}="{value}"' for key, value in (labels or {}).items()]
+    lines = [
+        "# HELP docsage_stage_seconds Latency of each processing stage.",
+        "# TYPE docsage_stage_seconds summary",
+    ]
+
+    def series(metric, value, *pairs):
+        names = ",".join([*pairs, *common])
+        lines.append(f"{metric}{{{names}}} {value}" if names else f"{metric} {value}")
+
+    for stage, stats in summarize(snap).items():
+        count, total = snap["totals"][stage]
+        label = f'stage="{stage}"'
+        series("docsage_stage_seconds", stats["p50"], label, 'quantile="0.5"')
+        series("docsage_stage_seconds", stats["p95"], label, 'quantile="0.95"')
+        series("docsage_stage_seconds_count", count, label)
+        series("docsage_stage_seconds_sum", total, label)
+    for name, value in sorted(snap["counters"].items()):
+        # The metric family is named without the `_total` its sample carries
+        metric = f"docsage_{_metric_name(name)}"
+        lines.append(f"# TYPE {metric} counter")
+        series(f"{metric}_total", value)
+    for name, value in sorted(snap["gauges"].items()):
+        metric = f"docsage_{_metric_name(name)}"
+        lines.append(f"# TYPE {metric} gauge")
+        series(metric, value)
+    return "\n".join(lines) + "\n"
+
+
+def _export_paths(directory: str, pid: int) -> list[str]:
+    base = os.path.join(directory, str(pid))
+    return [base + ".json", base + ".prom"]
+
+
+def export(directory: str = METRICS_DIR):
+    """
+    Write this process's snapshot as JSON and as Prometheus text.
+
+    The `.prom` file can be picked up by node_exporter's textfile collector; its
+    series carry a `pid` label so the files of different processes don't clash.
+
+    Args:
+        directory (str): Directory to write `{pid}.json` and `{pid}.prom` to.
+    """
+    os.makedirs(directory, exist_ok=True)
+    snap = snapshot()
+    json_path, prom_path = _export_paths(directory, snap["pid"])
+    outputs = (
+        (json_path, json.dumps(snap)),
+        (prom_path, prometheus_text(snap, labels={"pid": snap["pid"]})),
+    )
+    for path, text in outputs:
+        # Write atomically so readers never see a partial file
+        with open(path + ".tmp", "w") as f:
+            f.write(text)
+        os.replace(path + ".tmp", path)
+
+
+def prune(directory: str = METRICS_DIR, max_age: float = STALE_SECONDS):
+    """
+    Delete the exports of processes that stopped without removing them, e.g. after
+    a crash, so the textfile collector does not keep serving them.
+
+    Args:
+        directory (str): Directory the processes export to.
+        max_age (float): Exports not rewritten for this many seconds are deleted.
+    """
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if not name.endswith((".json", ".prom", ".tmp")):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            if time.time() - os.path.getmtime(path) > max_age:
+                os.remove(path)
+        except OSError:
+            # Removed by another process meanwhile
+            continue
+
+
+def _remove_export(directory: str):
+    for path in _export_paths(directory, os.getpid()):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def start_exporter(directory: str = METRICS_DIR, interval: float = 15.0):
+    """
+    Export this process's metrics every `interval` seconds from a daemon thread.
+
+    The exports are removed when the process exits, and those that other processes
+    left behind are pruned along the way. Does nothing when tracing is disabled or
+    the exporter is already running.
+
+    Args:
+        directory (str): Directory to export to.
+        interval (float): Seconds between exports.
+    """
+    global _exporter
+    if not ENABLED or _exporter is not None:
+        return
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                export(directory)
+                prune(directory, max(STALE_SECONDS, 4 * interval))
+            except OSError:
+                pass
+
+    atexit.register(_remove_export, directory)
+    _exporter = threading.Thread(target=run, name="metrics-exporter", daemon=True)
+    _exporter.start()
+
+
+def collect(directory: str = METRICS_DIR, max_age: float = STALE_SECONDS) -> dict:
+    """
+    Merge this process's live metrics with the latest exports of other processes.
+
+    Args:
+        directory (str): Directory the processes export to.
+        max_age (float): Exports older than this many seconds (from processes that
+                         have exited) are ignored.
+
+    Returns:
+        dict: The merged snapshot.
+    """
+    snapshots = [snapshot()]
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if not name.endswith(".json") or name == f"{os.getpid()}.json":
+                continue
+            path = os.path.join(directory, name)
+            try:
+                if time.time() - os.path.getmtime(path) > max_age:
+                    continue
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return merge(snapshots)
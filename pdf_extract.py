@@ -0,0 +1,138 @@
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional
+
+from langchain_core.document_loaders import BaseLoader
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+
+def _extract_pages(file_path: str, start: int, stop: int) -> list[str]:
+    # Runs in a worker process; each worker parses the file on its own
+    from pypdf import PdfReader
+
+    reader = PdfReader(file_path)
+    return [reader.pages[number].extract_text() for number in range(start, stop)]
+
+
+def count_pages(file_path: str) -> Optional[int]:
+    """
+    Count the pages of a PDF that can be read without a password.
+
+    Args:
+        file_path (str): Path to the PDF.
+
+    Returns:
+        int | None: The page count, or None if the file is encrypted or malformed.
+    """
+    from pypdf import PdfReader
+
+    try:
+        reader = PdfReader(file_path)
+        if reader.is_encrypted:
+            return None
+        return len(reader.pages)
+    except Exception:
+        return None
+
+
+class ParallelPDFLoader(BaseLoader):
+    """
+    PDF loader that extracts page ranges on a process pool.
+
+    Pages are split into ranges of `pages_per_task` and extracted by up to `workers`
+    processes; the page Documents are yielded in page order as soon as each range
+    is ready, with the same `source` and `page` metadata as PyPDFLoader. Small,
+    encrypted and malformed files are read with PyPDFLoader instead. If a worker
+    fails, the rest of the file is extracted in this process, starting from the
+    first missing page.
+
+    Args:
+        file_path (str): Path to the PDF.
+        workers (int, optional): Worker processes; defaults to the number of CPUs.
+                                 With 1 the file is always read sequentially.
+        min_pages (int): Files with fewer pages are read sequentially.
+        pages_per_task (int): Pages extracted per task.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        workers: int = None,
+        min_pages: int = 64,
+        pages_per_task: int = 16,
+    ):
+        self.file_path = file_path
+        self.workers = workers or os.cpu_count() or 1
+        self.min_pages = min_pages
+        self.pages_per_task = pages_per_task
+
+    def _sequential(self) -> Iterator[Document]:
+        from langchain_community.document_loaders import PyPDFLoader
+
+        return PyPDFLoader(self.file_path).lazy_load()
+
+    def _sequential_from(self, start: int) -> Iterator[Document]:
+        # Picks up after the pages already yielded without re-extracting them
+        from pypdf import PdfReader
+
+        reader = PdfReader(self.file_path)
+        for number in range(start, len(reader.pages)):
+            yield Document(
+                page_content=reader.pages[number].extract_text(),
+                metadata={"source": self.file_path, "page": number},
+            )
+
+    def lazy_load(self) -> Iterator[Document]:
+        page_count = count_pages(self.file_path) if self.workers > 1 else None
+        if not page_count or page_count < self.min_pages:
+            yield from self._sequential()
+            return
+
+        next_page = 0
+        tasks = -(-page_count // self.pages_per_task)
+        # Spawn rather than fork so workers don't inherit open SQLite connections
+        executor = ProcessPoolExecutor(
+            max_workers=min(self.workers, tasks),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        try:
+            starts = iter(range(0, page_count, self.pages_per_task))
+            pending = deque()
+
+            def submit_next():
+                start = next(starts, None)
+                if start is not None:
+                    stop = min(start + self.pages_per_task, page_count)
+                    pending.append(
+                        executor.submit(_extract_pages, self.file_path, start, stop)
+                    )
+
+            # Keep a couple of ranges per worker in flight so pages stream in order
+            # without holding the whole book in memory
+            for _ in range(2 * self.workers):
+                submit_next()
+
+            while pending:
+                texts = pending.popleft().result()
+                submit_next()
+                for text in texts:
+                    yield Document(
+                        page_content=text,
+                        metadata={"source": self.file_path, "page": next_page},
+                    )
+                    next_page += 1
+        except Exception:
+            logger.warning(
+                "Parallel extraction of %s failed at page %d, continuing sequentially",
+                self.file_path,
+                next_page,
+                exc_info=True,
+            )
+            yield from self._sequential_from(next_page)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
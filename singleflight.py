@@ -0,0 +1,166 @@
+import contextvars
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Stream:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.items = []
+        self.finished = False
+        self.error = None
+        # Callers still reading; guarded by the SingleFlight's lock
+        self.consumers = 1
+
+    def publish(self, item):
+        with self.condition:
+            self.items.append(item)
+            self.condition.notify_all()
+
+    def finish(self, error=None):
+        with self.condition:
+            self.finished = True
+            self.error = error
+            self.condition.notify_all()
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical requests into one computation.
+
+    The first caller for a key (the leader) runs the work; callers arriving with the
+    same key while it is in flight wait for and share its result instead of
+    repeating it. Nothing is kept once the work finishes, so this complements
+    result caches rather than replacing them.
+
+    Attributes:
+        calls (int): Computations actually run.
+        coalesced (int): Requests that shared another request's computation.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._streams = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, function):
+        """
+        Run `function()` once for all concurrent callers with the same key.
+
+        Args:
+            key (Hashable): Identifies identical requests.
+            function (callable): The work to run.
+
+        Returns:
+            The result of `function`.
+
+        Raises:
+            Exception: Whatever `function` raised, in the leader and every follower.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stream(self, key, make_iterator):
+        """
+        Share one streamed computation among concurrent callers with the same key.
+
+        The first caller starts a background thread that iterates `make_iterator()`.
+        Every caller, the first included, replays the items produced so far and then
+        receives new ones as they arrive, so each still streams and none depends on
+        another one reading. The thread stops early once every caller has closed
+        its iterator.
+
+        Args:
+            key (Hashable): Identifies identical requests.
+            make_iterator (callable): Returns the iterator to share.
+
+        Returns:
+            Iterator: The shared items, in order.
+        """
+        with self._lock:
+            shared = self._streams.get(key)
+            if shared is None:
+                shared = self._streams[key] = _Stream()
+                self.calls += 1
+                # Carry the caller's context (e.g. tracing callbacks) into the thread
+                context = contextvars.copy_context()
+                threading.Thread(
+                    target=context.run,
+                    args=(self._produce, key, shared, make_iterator),
+                    name="singleflight-stream",
+                    daemon=True,
+                ).start()
+            else:
+                shared.consumers += 1
+                self.coalesced += 1
+        return self._follow(key, shared)
+
+    def _produce(self, key, shared, make_iterator):
+        error = None
+        try:
+            for item in make_iterator():
+                shared.publish(item)
+                with self._lock:
+                    if not shared.consumers:
+                        # Everyone stopped reading; _follow already let go of the key
+                        break
+        except BaseException as e:
+            error = e
+        finally:
+            with self._lock:
+                if self._streams.get(key) is shared:
+                    del self._streams[key]
+            shared.finish(error)
+
+    def _follow(self, key, shared):
+        index = 0
+        try:
+            while True:
+                with shared.condition:
+                    while index >= len(shared.items) and not shared.finished:
+                        shared.condition.wait()
+                    items = shared.items[index:]
+                    finished = shared.finished
+                yield from items
+                index += len(items)
+                if finished and index >= len(shared.items):
+                    if shared.error is not None:
+                        raise shared.error
+                    return
+        finally:
+            with self._lock:
+                shared.consumers -= 1
+                if not shared.consumers and self._streams.get(key) is shared:
+                    # Don't let a new caller join a stream that is about to stop
+                    del self._streams[key]
@@ -1,74 +1,670 @@
+import time
+
+# Measured for the startup report
+_import_started = time.perf_counter()
+
+import hashlib
+import json
+import logging
 import os
-from langchain_chroma import Chroma
-#from langchain_openai import OpenAIEmbeddings
-from langchain_huggingface import HuggingFaceEmbeddings
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import islice
+from typing import Iterable, Iterator
+from langchain_core.document_loaders import BaseLoader
 from langchain_core.documents import Document
 from langchain_text_splitters import CharacterTextSplitter
-#from langchain_openai import ChatOpenAI
-from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
-from langchain_community.document_loaders import (
-    TextLoader,
-    CSVLoader,
-    PyPDFLoader,
-    Docx2txtLoader,
-    UnstructuredHTMLLoader,
-    UnstructuredMarkdownLoader,
-)
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
 import environ
 
+from answer_cache import AnswerCache, normalize_question
+from context_assembly import assemble_context
+from db import (
+    add_chunks,
+    add_document_chunks,
+    create_source,
+    delete_chat,
+    delete_chunk_ids,
+    delete_chunks,
+    delete_orphan_document_chunks,
+    delete_source,
+    find_source,
+    list_active_job_hashes,
+    list_chats_with_content,
+    list_chunk_hashes,
+    list_content_hashes,
+    list_document_chunks,
+    list_jobs,
+    list_sources,
+    read_chat,
+    read_parsed_document,
+    read_source,
+    save_parsed_document,
+    set_document_chunks,
+    transaction,
+)
+from embedding_cache import CachedEmbeddings, text_hash
+from hybrid_retriever import HybridRetriever, retrieval_flights
+from jobs import cancel
+from metrics import record, register_gauges, span, timed, timed_iter
+from pdf_extract import ParallelPDFLoader
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Identical questions asked of the same chat at the same moment share one retrieval
+# and one model call
+answer_flights = SingleFlight()
+
 env = environ.Env()
 # reading .env file
 environ.Env.read_env()
 
-#llm = ChatOpenAI(
-#    model="gpt-4o-mini",
-#    api_key=env("OPENAI_API_KEY"),
-#)
-llm = ChatGroq(
-    model="llama-3.3-70b-versatile",
-    api_key=env("GROQ_API_KEY"),
-)
-#embeddings = OpenAIEmbeddings(
-#    api_key=env("OPENAI_API_KEY"),
-#)
-embeddings = HuggingFaceEmbeddings(model_name='distilbert-base-uncased')
-text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
+LLM_MODEL = "llama-3.3-70b-versatile"
+EMBEDDING_MODEL = "distilbert-base-uncased"
+
+# Models are created on first use (or by warm_up) rather than at import time, so
+# pages and processes that never embed or generate don't pay for loading them.
+_models = {}
+_model_locks = {name: threading.Lock() for name in ("llm", "embeddings", "answer_cache")}
+_startup_timings = {}
+
+
+def _singleton(name, factory):
+    model = _models.get(name)
+    if model is None:
+        with _model_locks[name]:
+            model = _models.get(name)
+            if model is None:
+                started = time.perf_counter()
+                model = factory()
+                _startup_timings[f"load_{name}"] = time.perf_counter() - started
+                _models[name] = model
+    return model
 
 
-def load_document(file_path: str) -> list[Document]:
+def get_llm():
     """
-    Load a document from a file path.
-    Supports .txt, .pdf, .docx, .csv, .html, and .md files.
+    Return the process-wide chat model, creating it on first use.
+
+    Returns:
+        BaseChatModel: The Groq chat model.
+    """
+
+    def create():
+        from langchain_groq import ChatGroq
+
+        #return ChatOpenAI(model="gpt-4o-mini", api_key=env("OPENAI_API_KEY"))
+        return ChatGroq(model=LLM_MODEL, api_key=env("GROQ_API_KEY"))
+
+    return _singleton("llm", create)
+
+
+def get_embeddings():
+    """
+    Return the process-wide embedding model, loading it on first use.
+
+    Chunk embeddings are cached on disk so re-ingesting known text never re-runs
+    the model. The inference backend is chosen with EMBEDDING_BACKEND ("torch",
+    "int8" or "onnx"), with EMBEDDING_BATCH_SIZE and EMBEDDING_THREADS to tune it.
+
+    Returns:
+        CachedEmbeddings: The cached embedding model.
+    """
+
+    def create():
+        from embedding_engine import EmbeddingEngine
+
+        backend = env("EMBEDDING_BACKEND", default="torch")
+        #return OpenAIEmbeddings(api_key=env("OPENAI_API_KEY"))
+        return CachedEmbeddings(
+            EmbeddingEngine(
+                model_name=EMBEDDING_MODEL,
+                backend=backend,
+                batch_size=env.int("EMBEDDING_BATCH_SIZE", default=32),
+                num_threads=env.int("EMBEDDING_THREADS", default=0) or None,
+            ),
+            # Other backends give slightly different vectors, so cache them apart;
+            # torch keeps the plain model name and with it any existing cache
+            model_name=EMBEDDING_MODEL if backend == "torch" else f"{EMBEDDING_MODEL}:{backend}",
+            cache_path=env(
+                "EMBEDDING_CACHE_PATH",
+                default=os.path.join(PERSIST_DIRECTORY, "embedding_cache.sqlite"),
+            ),
+            max_entries=env.int("EMBEDDING_CACHE_MAX_ENTRIES", default=200_000),
+            query_cache_size=env.int("QUERY_EMBEDDING_CACHE_SIZE", default=1024),
+        )
+
+    return _singleton("embeddings", create)
+
+
+def get_answer_cache():
+    """
+    Return the process-wide answer cache, which reuses answers to repeated or
+    near-duplicate questions within a chat.
+
+    Returns:
+        AnswerCache: The answer cache.
+    """
+    return _singleton(
+        "answer_cache",
+        lambda: AnswerCache(
+            get_embeddings(),
+            # Near-duplicate matching is opt-in: unrelated questions often score
+            # above 0.95 with mean-pooled distilbert vectors
+            similarity_threshold=env.float("ANSWER_CACHE_THRESHOLD", default=None),
+            ttl_seconds=env.int("ANSWER_CACHE_TTL_SECONDS", default=24 * 60 * 60),
+            max_entries=env.int("ANSWER_CACHE_MAX_ENTRIES", default=500),
+        ),
+    )
+
+
+def _cache_gauges():
+    # Only report models that exist; reading them must not trigger loading
+    gauges = {}
+    for name, model in (
+        ("embedding", _models.get("embeddings")),
+        ("answer", _models.get("answer_cache")),
+    ):
+        if model is not None:
+            gauges[f"{name}_hits"] = model.hits
+            gauges[f"{name}_misses"] = model.misses
+    embeddings = _models.get("embeddings")
+    if embeddings is not None:
+        stats = embeddings.stats()
+        for key in ("query_hits", "query_misses", "query_coalesced"):
+            gauges[f"embedding_{key}"] = stats[key]
+    return gauges
+
+
+def _singleflight_gauges():
+    return {
+        "answer_calls": answer_flights.calls,
+        "answer_coalesced": answer_flights.coalesced,
+        "retrieval_calls": retrieval_flights.calls,
+        "retrieval_coalesced": retrieval_flights.coalesced,
+    }
+
+
+register_gauges("cache", _cache_gauges)
+register_gauges("singleflight", _singleflight_gauges)
+
+
+def warm_up(background: bool = True):
+    """
+    Load the models and open the Chroma client ahead of the first request.
+
+    Args:
+        background (bool): Run in a daemon thread and return immediately.
+
+    Returns:
+        threading.Thread | None: The warm-up thread when run in the background.
+    """
+
+    def run():
+        started = time.perf_counter()
+        get_embeddings().embed_query("warm up")
+        get_llm()
+        get_client()
+        _startup_timings["warm_up"] = time.perf_counter() - started
+        logger.info("Startup report: %s", startup_report())
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def startup_report() -> dict:
+    """
+    Return how long importing this module and loading each model took.
+
+    Returns:
+        dict: Seconds per step, e.g. `import`, `load_embeddings`, `load_llm`, `warm_up`.
+            Steps that have not happened yet are missing.
+    """
+    return dict(_startup_timings)
+
+
+CHUNK_SIZE = 1000
+text_splitter = CharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=0)
+
+SUPPORTED_EXTENSIONS = (".txt", ".pdf", ".docx", ".csv", ".html", ".md")
+
+PERSIST_DIRECTORY = "./persist"
+# Every chat's chunks live once in this shared, content-addressed collection; a chat
+# only records which content hashes it uses in its `sources` rows
+CORPUS_COLLECTION = "corpus"
+# "hybrid" fuses vector and BM25 results, "similarity" uses vector search only
+RETRIEVAL_MODE = env("RETRIEVAL_MODE", default="hybrid")
+# Upper bound on prompt context size, and similarity at which chunks count as
+# duplicates. Semantic pruning is opt-in, like the answer cache's near-duplicate
+# matching: unrelated chunks often score above 0.9 with mean-pooled distilbert
+# vectors, so by default only identical text is removed
+CONTEXT_TOKEN_BUDGET = env.int("CONTEXT_TOKEN_BUDGET", default=2000)
+CONTEXT_REDUNDANCY_THRESHOLD = env.float("CONTEXT_REDUNDANCY_THRESHOLD", default=None)
+# Maximum number of collections (and their retrievers) kept open at once
+MAX_OPEN_COLLECTIONS = env.int("MAX_OPEN_COLLECTIONS", default=32)
+# "chroma" stores collections in Chroma, "matrix" as memory-mapped float16 matrices
+# searched exactly, with an HNSW index only above MATRIX_ANN_THRESHOLD chunks
+VECTOR_BACKEND = env("VECTOR_BACKEND", default="chroma")
+MATRIX_ANN_THRESHOLD = env.int("MATRIX_ANN_THRESHOLD", default=20_000)
+
+# PDFs of at least PDF_PARALLEL_MIN_PAGES pages are extracted on PDF_WORKERS
+# processes (0 means one per CPU, 1 turns parallel extraction off)
+PDF_WORKERS = env.int("PDF_WORKERS", default=0)
+PDF_PARALLEL_MIN_PAGES = env.int("PDF_PARALLEL_MIN_PAGES", default=64)
+
+# Process-wide handle pool shared by all Streamlit sessions
+_handle_lock = threading.RLock()
+_clients = {}
+_collections = OrderedDict()
+_retrievers = {}
+
+# Vector-store writes from the app and the job workers are serialized through a
+# lock file, and every write bumps a counter so other processes reopen their Chroma
+# handles instead of serving, or overwriting, a stale in-memory index
+_WRITE_LOCK_PATH = os.path.join(PERSIST_DIRECTORY, ".write.lock")
+_GENERATION_PATH = os.path.join(PERSIST_DIRECTORY, ".generation")
+# The embedding model the corpus vectors were made with, so re-embedding only part
+# of the corpus with another model can be refused
+_CORPUS_MODEL_PATH = os.path.join(PERSIST_DIRECTORY, "corpus_embedding_model")
+_corpus_model_recorded = False
+_write_state = threading.local()
+_process_write_lock = threading.RLock()
+_seen_generation = None
+
+
+def _read_generation() -> int:
+    try:
+        with open(_GENERATION_PATH) as f:
+            return int(f.read() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def refresh_handles():
+    """
+    Reopen the vector store if another process wrote to it since our last look.
+
+    Chroma keeps each collection's index in memory, so without this a process would
+    not see vectors added by the job workers. Matrix collections notice other
+    processes' writes on their own.
+    """
+    global _seen_generation
+    generation = _read_generation()
+    with _handle_lock:
+        if generation == _seen_generation:
+            return
+        reopen = _seen_generation is not None
+        _seen_generation = generation
+        if not reopen or VECTOR_BACKEND == "matrix":
+            return
+        _collections.clear()
+        _retrievers.clear()
+        _clients.clear()
+        from chromadb.api.client import SharedSystemClient
+
+        SharedSystemClient.clear_system_cache()
+
+
+@contextmanager
+def vector_write():
+    """
+    Hold the cross-process vector-store write lock around a group of writes.
+
+    Re-entrant within a thread. Handles are refreshed when the lock is taken, so the
+    writes go to an up-to-date index, and other processes are told to refresh once
+    the lock is released.
+    """
+    depth = getattr(_write_state, "depth", 0)
+    if depth:
+        _write_state.depth += 1
+        try:
+            yield
+        finally:
+            _write_state.depth -= 1
+        return
+
+    global _seen_generation
+    os.makedirs(PERSIST_DIRECTORY, exist_ok=True)
+    with _process_write_lock, open(_WRITE_LOCK_PATH, "a") as lock_file:
+        try:
+            import fcntl
+        except ImportError:
+            # No advisory file locks on this platform: only threads are serialized
+            fcntl = None
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        _write_state.depth = 1
+        try:
+            refresh_handles()
+            yield
+        finally:
+            _write_state.depth = 0
+            generation = _read_generation() + 1
+            with open(_GENERATION_PATH, "w") as f:
+                f.write(str(generation))
+            with _handle_lock:
+                _seen_generation = generation
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def corpus_embedding_model():
+    """
+    Return the name of the embedding model the corpus was built with.
+
+    Returns:
+        str | None: The model name, or None if nothing was added to the corpus since
+            the model started being recorded.
+    """
+    try:
+        with open(_CORPUS_MODEL_PATH) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def set_corpus_embedding_model(model_name: str):
+    """
+    Record the embedding model the corpus is built with, e.g. once every document
+    was re-embedded with a new one.
+
+    Args:
+        model_name (str): The model name, as in CachedEmbeddings.model_name.
+    """
+    global _corpus_model_recorded
+    os.makedirs(PERSIST_DIRECTORY, exist_ok=True)
+    with open(_CORPUS_MODEL_PATH + ".tmp", "w") as f:
+        f.write(model_name)
+    os.replace(_CORPUS_MODEL_PATH + ".tmp", _CORPUS_MODEL_PATH)
+    _corpus_model_recorded = True
+
+
+def _record_corpus_embedding_model():
+    # The first write to the corpus records the model; later ones leave it alone
+    global _corpus_model_recorded
+    if _corpus_model_recorded:
+        return
+    if corpus_embedding_model() is None:
+        set_corpus_embedding_model(get_embeddings().model_name)
+    _corpus_model_recorded = True
+
+
+class TextBlockLoader(BaseLoader):
+    """
+    Plain-text loader that reads the file in blocks instead of all at once.
+
+    Each block ends at the last paragraph break (or line break) inside it, which is
+    where the text splitter cuts anyway, so chunks rarely straddle two blocks. Text
+    without line breaks is cut at the last space instead, or at the block's end, so
+    memory stays bounded by the block size whatever the file looks like.
+
+    Args:
+        file_path (str): Path to the text file.
+        block_size (int): Approximate number of characters per Document.
+        encoding (str, optional): File encoding, the platform default if not given.
+    """
+
+    def __init__(self, file_path: str, block_size: int = 1 << 20, encoding: str = None):
+        self.file_path = file_path
+        self.block_size = block_size
+        self.encoding = encoding
+
+    def lazy_load(self) -> Iterator[Document]:
+        remainder = ""
+        with open(self.file_path, encoding=self.encoding) as f:
+            while True:
+                block = f.read(self.block_size)
+                if not block:
+                    break
+                text = remainder + block
+                cut = text.rfind("\n\n")
+                if cut <= 0:
+                    cut = text.rfind("\n")
+                if cut <= 0:
+                    cut = max(text.rfind(" "), text.rfind("\t"))
+                if cut <= 0:
+                    cut = len(text)
+                remainder = text[cut:]
+                yield Document(page_content=text[:cut], metadata={"source": self.file_path})
+        if remainder.strip():
+            yield Document(page_content=remainder, metadata={"source": self.file_path})
+
+
+def _get_loader(file_path: str, pdf_workers: int = None):
+    """
+    Pick the document loader for a file based on its extension.
 
     Args:
     file_path (str): Path to the document file.
+    pdf_workers (int, optional): Processes used to extract large PDFs,
+                                 defaults to PDF_WORKERS.
 
     Returns:
-    list[Document]: A list of Document objects.
+    BaseLoader: A loader instance for the file.
 
     Raises:
     ValueError: If the file type is not supported.
     """
+    from langchain_community.document_loaders import (
+        CSVLoader,
+        Docx2txtLoader,
+        UnstructuredHTMLLoader,
+        UnstructuredMarkdownLoader,
+    )
+
     _, file_extension = os.path.splitext(file_path)
 
     if file_extension == ".txt":
-        loader = TextLoader(file_path)
+        return TextBlockLoader(file_path)
     elif file_extension == ".pdf":
-        loader = PyPDFLoader(file_path)
+        return ParallelPDFLoader(
+            file_path,
+            workers=pdf_workers or PDF_WORKERS or None,
+            min_pages=PDF_PARALLEL_MIN_PAGES,
+        )
     elif file_extension == ".docx":
-        loader = Docx2txtLoader(file_path)
+        return Docx2txtLoader(file_path)
     elif file_extension == ".csv":
-        loader = CSVLoader(file_path)
+        return CSVLoader(file_path)
     elif file_extension == ".html":
-        loader = UnstructuredHTMLLoader(file_path)
+        return UnstructuredHTMLLoader(file_path)
     elif file_extension == ".md":
-        loader = UnstructuredMarkdownLoader(file_path)
+        return UnstructuredMarkdownLoader(file_path)
     else:
         raise ValueError(f"Unsupported file type: {file_extension}")
 
-    return loader.load()
+
+def load_document(file_path: str, pdf_workers: int = None) -> list[Document]:
+    """
+    Load a document from a file path.
+    Supports .txt, .pdf, .docx, .csv, .html, and .md files.
+
+    Args:
+    file_path (str): Path to the document file.
+    pdf_workers (int, optional): Processes used to extract large PDFs,
+                                 defaults to PDF_WORKERS.
+
+    Returns:
+    list[Document]: A list of Document objects.
+
+    Raises:
+    ValueError: If the file type is not supported.
+    """
+    with span("load_document"):
+        return _get_loader(file_path, pdf_workers=pdf_workers).load()
+
+
+def lazy_load_document(file_path: str) -> Iterator[Document]:
+    """
+    Lazily load a document from a file path, one Document at a time.
+
+    PDFs are yielded page by page, CSVs row by row and text files in blocks, so
+    those are never held in memory at once. Large PDFs are extracted on several
+    processes and still yielded in page order. The .docx, .html and .md loaders
+    parse the whole file and yield it as one Document, so their memory still grows
+    with the file size.
+
+    Args:
+    file_path (str): Path to the document file.
+
+    Returns:
+    Iterator[Document]: An iterator over the file's Document objects.
+
+    Raises:
+    ValueError: If the file type is not supported.
+    """
+    return _lazy_load(file_path)
+
+
+class _PageEncoder:
+    """
+    Compress pages for the parse cache as they arrive, one JSON line per page, so a
+    large document is never held in memory as text all at once.
+    """
+
+    def __init__(self):
+        self._compressor = zlib.compressobj()
+        self._data = bytearray()
+        self.page_count = 0
+        self.text_size = 0
+
+    def add(self, document: Document):
+        line = json.dumps([document.page_content, document.metadata], default=str)
+        self._data += self._compressor.compress(line.encode("utf-8") + b"\n")
+        self.page_count += 1
+        self.text_size += len(document.page_content)
+
+    def save(self, content_hash: str, name: str):
+        self._data += self._compressor.flush()
+        save_parsed_document(
+            content_hash, name, bytes(self._data), self.page_count, self.text_size
+        )
+
+
+def _decode_pages(data: bytes, block_size: int = 1 << 16) -> Iterator[Document]:
+    decompressor = zlib.decompressobj()
+    buffer = bytearray()
+
+    def documents(line):
+        item = json.loads(line)
+        # Rows stored before pages were written one per line hold a single list
+        pairs = item if not item or isinstance(item[0], list) else [item]
+        for text, metadata in pairs:
+            yield Document(page_content=text, metadata=metadata)
+
+    for start in range(0, len(data), block_size):
+        buffer += decompressor.decompress(data[start : start + block_size])
+        end = buffer.rfind(b"\n")
+        if end >= 0:
+            for line in bytes(buffer[:end]).split(b"\n"):
+                yield from documents(line)
+            del buffer[: end + 1]
+    buffer += decompressor.flush()
+    if buffer.strip():
+        yield from documents(bytes(buffer))
+
+
+def store_parsed_document(content_hash: str, name: str, documents: Iterable[Document]):
+    """
+    Store a document's extracted text and page metadata, compressed, in the parse cache.
+
+    Args:
+    content_hash (str): Hash of the original file or documents.
+    name (str): Display name of the document.
+    documents (Iterable[Document]): The extracted pages.
+    """
+    encoder = _PageEncoder()
+    for document in documents:
+        encoder.add(document)
+    encoder.save(content_hash, name)
+
+
+def load_parsed_document(content_hash: str):
+    """
+    Load a document's pages from the parse cache.
+
+    Pages are decompressed as they are iterated, so only the compressed row is
+    held in memory.
+
+    Args:
+    content_hash (str): Hash of the original file or documents.
+
+    Returns:
+    Iterator[Document] | None: The stored pages, or None if the content was never parsed.
+    """
+    row = read_parsed_document(content_hash)
+    if row is None:
+        return None
+    return _decode_pages(row[1])
+
+
+def iter_parsed_document(
+    file_path: str = None,
+    content_hash: str = None,
+    name: str = None,
+    pdf_workers: int = None,
+) -> Iterator[Document]:
+    """
+    Yield a file's pages, from the parse cache if the same content was parsed before.
+
+    New files are parsed lazily; their pages are compressed as they are yielded and
+    stored in the parse cache once the whole file has been read, so the next
+    upload, re-chunk or re-embed of the same content never parses it again.
+
+    Args:
+    file_path (str, optional): Path of the file; not needed if the content is cached.
+    content_hash (str, optional): Hash of the file. Computed if not given.
+    name (str, optional): Display name stored with the text, defaults to the file name.
+    pdf_workers (int, optional): Processes used to extract large PDFs.
+
+    Returns:
+    Iterator[Document]: An iterator over the file's pages.
+
+    Raises:
+    ValueError: If the content is not cached and there is no file to parse.
+    """
+    content_hash = content_hash or file_hash(file_path)
+    documents = load_parsed_document(content_hash)
+    if documents is not None:
+        yield from documents
+        return
+    if not file_path:
+        raise ValueError(f"No file or stored text for content {content_hash}")
+
+    encoder = _PageEncoder()
+    for document in _lazy_load(file_path, pdf_workers):
+        encoder.add(document)
+        yield document
+    encoder.save(content_hash, name or os.path.basename(file_path))
+
+
+def _lazy_load(file_path: str, pdf_workers: int = None) -> Iterator[Document]:
+    loader = _get_loader(file_path, pdf_workers=pdf_workers)
+    return timed_iter(loader.lazy_load(), "load_document")
+
+
+def iter_split_documents(documents: Iterable[Document]) -> Iterator[Document]:
+    """
+    Split documents into chunks as they arrive instead of materializing the full list.
+
+    Args:
+    documents (Iterable[Document]): The documents to split.
+
+    Returns:
+    Iterator[Document]: An iterator over the text chunks.
+    """
+    for document in documents:
+        with span("split"):
+            chunks = text_splitter.split_documents([document])
+        yield from chunks
 
 
 def create_collection(collection_name, documents):
@@ -83,19 +679,15 @@ def create_collection(collection_name, documents):
     None
 
     This function splits the documents into texts, creates a new Chroma collection,
-    and persists it to disk.
+    and persists it to disk. Chunks are embedded and written in fixed-size windows.
     """
-    # Split the documents into smaller text chunks
-    texts = text_splitter.split_documents(documents)
-    persist_directory = "./persist"
-
-    # Create a new Chroma collection from the text chunks
+    # Create a new Chroma collection and stream the split chunks into it
     try:
-        vectordb = Chroma.from_documents(
-            documents=texts,
-            embedding=embeddings,
-            persist_directory=persist_directory,
-            collection_name=collection_name,
+        vectordb = load_collection(collection_name)
+        _add_in_windows(
+            collection_name,
+            iter_split_documents(documents),
+            content_hash=documents_hash(documents),
         )
     except Exception as e:
         print(f"Error creating collection: {e}")
@@ -112,58 +704,198 @@ def load_collection(collection_name):
     collection_name (str): The name of the collection to load.
 
     Returns:
-    Chroma: The loaded Chroma collection.
+    VectorStore: The loaded Chroma collection, or a MatrixVectorStore when
+                 VECTOR_BACKEND is "matrix".
 
-    This function loads a previously created Chroma collection from disk.
+    This function loads a previously created Chroma collection from disk. Handles are
+    pooled per process and the least recently used ones are closed once more than
+    MAX_OPEN_COLLECTIONS are open.
     """
-    persist_directory = "./persist"
-    # Load the Chroma collection from the specified directory
-    vectordb = Chroma(
-        persist_directory=persist_directory,
-        embedding_function=embeddings,
-        collection_name=collection_name,
-    )
+    refresh_handles()
+    if VECTOR_BACKEND != "matrix" and collection_name not in _collections:
+        # Chroma would create an empty collection if a crashed compaction left it
+        # renamed, so finish the compaction first
+        names = {collection.name for collection in get_client().list_collections()}
+        if {f"{collection_name}_old", f"{collection_name}_compact"} & names:
+            with vector_write():
+                _recover_compaction(get_client(), collection_name)
+    with _handle_lock:
+        vectordb = _collections.get(collection_name)
+        if vectordb is not None:
+            _collections.move_to_end(collection_name)
+            return vectordb
+
+        if VECTOR_BACKEND == "matrix":
+            from matrix_store import MatrixVectorStore
+
+            vectordb = MatrixVectorStore(
+                collection_name,
+                get_embeddings(),
+                PERSIST_DIRECTORY,
+                ann_threshold=MATRIX_ANN_THRESHOLD,
+            )
+        else:
+            from langchain_chroma import Chroma
+
+            # Load the Chroma collection through the shared client for the persist directory
+            vectordb = Chroma(
+                client=get_client(PERSIST_DIRECTORY),
+                embedding_function=get_embeddings(),
+                collection_name=collection_name,
+            )
+        _collections[collection_name] = vectordb
+        while len(_collections) > MAX_OPEN_COLLECTIONS:
+            evicted, _ = _collections.popitem(last=False)
+            _drop_retrievers(evicted)
 
     return vectordb
 
 
-def load_retriever(collection_name, score_threshold: float = 0.6):
+def get_client(persist_directory: str = PERSIST_DIRECTORY):
+    """
+    Return the process-wide Chroma client for a persist directory, creating it once.
+
+    Args:
+    persist_directory (str): The directory the Chroma data is stored in.
+
+    Returns:
+    chromadb.ClientAPI: The shared persistent client.
+    """
+    refresh_handles()
+    with _handle_lock:
+        client = _clients.get(persist_directory)
+        if client is None:
+            import chromadb
+
+            client = chromadb.PersistentClient(path=persist_directory)
+            _clients[persist_directory] = client
+        return client
+
+
+def raw_collection(collection_name):
+    """
+    Return the backend's own handle of a collection, for writes with precomputed
+    vectors and bulk reads that include embeddings.
+
+    Args:
+    collection_name (str): The name of the collection; created if it does not exist.
+
+    Returns:
+    chromadb.Collection | MatrixVectorStore: An object with Chroma's collection
+        methods (`get`, `upsert`, `delete`, `count`).
+    """
+    if VECTOR_BACKEND == "matrix":
+        return load_collection(collection_name)
+    return get_client().get_or_create_collection(collection_name)
+
+
+def list_collections() -> list[str]:
+    """
+    List the names of all collections of the configured vector backend.
+
+    Returns:
+    list[str]: The collection names.
+    """
+    if VECTOR_BACKEND == "matrix":
+        from matrix_store import list_matrix_collections
+
+        return list_matrix_collections(PERSIST_DIRECTORY)
+    return [collection.name for collection in get_client().list_collections()]
+
+
+def invalidate_collection(collection_name):
+    """
+    Drop the cached collection and retriever handles for a collection.
+
+    Call this whenever a chat's sources change so the next request sees a fresh handle.
+
+    Args:
+    collection_name (str): The name of the collection to invalidate.
+    """
+    with _handle_lock:
+        _collections.pop(collection_name, None)
+        _drop_retrievers(collection_name)
+
+
+def _drop_retrievers(collection_name):
+    # Chat retrievers are keyed by chat but search the corpus, so match both
+    for key in [
+        key
+        for key, retriever in _retrievers.items()
+        if collection_name in (key[0], retriever.collection_name)
+    ]:
+        del _retrievers[key]
+
+
+def load_retriever(
+    collection_name, score_threshold: float = 0.6, mode: str = None
+):
     """
     Create a retriever from a Chroma collection with a similarity score threshold.
 
     Args:
-    collection_name (str): The name of the collection to use.
+    collection_name (str): The name of the collection to use. For a `chat_{id}` name,
+                           the shared corpus is searched, restricted to the chunks of
+                           that chat's sources, along with the chat's own collection
+                           if it was never migrated to the corpus.
     score_threshold (float): The minimum similarity score threshold for retrieving documents.
                            Documents with scores below this threshold will be filtered out.
                            Defaults to 0.6.
+    mode (str, optional): "hybrid" to fuse vector results with BM25 results from the
+                          FTS5 chunk index, or "similarity" for vector search only.
+                          Defaults to RETRIEVAL_MODE.
 
     Returns:
     Retriever: A retriever object that can be used to query the collection with similarity
               score filtering.
 
     This function loads a Chroma collection and creates a retriever from it that will only
-    return documents meeting the specified similarity score threshold.
-    """
-    # Load the Chroma collection
-    vectordb = load_collection(collection_name)
-    # Create a retriever from the collection with specified search parameters
-    retriever = vectordb.as_retriever(
-        search_type="similarity_score_threshold",
-        search_kwargs={"score_threshold": score_threshold},
+    return documents meeting the specified similarity score threshold. The retriever is
+    cached alongside the collection handle.
+    """
+    # A cached retriever holds the collection's in-memory index, so drop it first if
+    # another process has written since
+    refresh_handles()
+    mode = mode or RETRIEVAL_MODE
+    key = (collection_name, score_threshold, mode)
+    chat_id = None
+    if collection_name.startswith("chat_"):
+        chat_id = int(collection_name.removeprefix("chat_"))
+    search_name = CORPUS_COLLECTION if chat_id is not None else collection_name
+    with _handle_lock:
+        retriever = _retrievers.get(key)
+    if retriever is not None:
+        return retriever
+
+    # Loaded outside the handle lock, since a load may wait for a compaction
+    vectordb = load_collection(search_name)
+    legacy_vectordb = None
+    if chat_id is not None and collection_name in list_collections():
+        # Not migrated to the corpus yet; searched alongside it until it is
+        legacy_vectordb = load_collection(collection_name)
+    # Create a retriever from the collection with specified search parameters;
+    # "similarity" mode is the same retriever without the BM25 side
+    retriever = HybridRetriever(
+        vectordb=vectordb,
+        collection_name=search_name,
+        score_threshold=score_threshold,
+        use_lexical=mode == "hybrid",
+        chat_id=chat_id,
+        legacy_vectordb=legacy_vectordb,
     )
+    with _handle_lock:
+        # Only cache it if the handle was not invalidated in the meantime
+        if _collections.get(search_name) is vectordb:
+            retriever = _retrievers.setdefault(key, retriever)
     return retriever
 
 
-def generate_answer_from_context(retriever, question: str):
+def build_answer_prompt():
     """
-    Ask a question and get an answer based on the provided context.
-
-    Args:
-        retriever: A retriever object to fetch relevant context.
-        question (str): The question to be answered.
+    Build the prompt that asks the model to answer from the retrieved context.
 
     Returns:
-        str: The answer to the question based on the retrieved context.
+        ChatPromptTemplate: A prompt with `question` and `context` variables.
     """
     # Define the message template for the prompt
     message = """
@@ -176,33 +908,704 @@ def generate_answer_from_context(retriever, question: str):
     """
 
     # Create a chat prompt template from the message
-    prompt = ChatPromptTemplate.from_messages([("human", message)])
+    return ChatPromptTemplate.from_messages([("human", message)])
+
+
+def format_context(documents: list[Document]) -> str:
+    """
+    Deduplicate retrieved chunks and fit them into the context token budget.
+
+    Args:
+        documents (list[Document]): Retrieved chunks, best first.
+
+    Returns:
+        str: The context text for the prompt.
+    """
+    return assemble_context(
+        documents,
+        get_embeddings(),
+        token_budget=CONTEXT_TOKEN_BUDGET,
+        redundancy_threshold=CONTEXT_REDUNDANCY_THRESHOLD,
+    )
+
+
+def build_rag_chain(retriever):
+    """
+    Build the RAG (Retrieval-Augmented Generation) chain for a retriever.
+
+    Args:
+        retriever: A retriever object to fetch relevant context.
+
+    Returns:
+        Runnable: A chain that takes a question and returns the model's message.
+    """
+    context = retriever | RunnableLambda(format_context)
 
-    # Create a RAG (Retrieval-Augmented Generation) chain
     # This chain retrieves context, passes through the question,
     # formats the prompt, and generates an answer using the language model
-    rag_chain = {"context": retriever, "question": RunnablePassthrough()} | prompt | llm
+    return (
+        {"context": context, "question": RunnablePassthrough()}
+        | build_answer_prompt()
+        | get_llm()
+    )
+
+
+def _answer_key(retriever, question: str):
+    return (*retriever.search_key(), normalize_question(question))
+
+
+@timed("answer.generate")
+def generate_answer_from_context(retriever, question: str):
+    """
+    Ask a question and get an answer based on the provided context.
+
+    Concurrent calls with the same question for the same retriever share one answer.
+
+    Args:
+        retriever: A retriever object to fetch relevant context.
+        question (str): The question to be answered.
+
+    Returns:
+        str: The answer to the question based on the retrieved context.
+    """
+    rag_chain = build_rag_chain(retriever)
 
     # Invoke the RAG chain with the question and return the generated content
-    return rag_chain.invoke(question).content
+    return answer_flights.do(
+        _answer_key(retriever, question), lambda: rag_chain.invoke(question).content
+    )
+
 
+def _stream_answer(retriever, question: str):
+    for chunk in build_rag_chain(retriever).stream(question):
+        if chunk.content:
+            yield chunk.content
 
-def add_documents_to_collection(vectordb, documents):
+
+def stream_answer_from_context(retriever, question: str, metrics: dict = None):
+    """
+    Ask a question and stream the answer as the model generates it.
+
+    Concurrent calls with the same question for the same retriever share one model
+    stream; later callers first replay what has been generated so far.
+
+    Args:
+        retriever: A retriever object to fetch relevant context.
+        question (str): The question to be answered.
+        metrics (dict, optional): If given, filled with `time_to_first_token`,
+                                  `total_time` (seconds) and `chunks` once the stream ends.
+
+    Yields:
+        str: Pieces of the answer text in generation order.
+    """
+    metrics = metrics if metrics is not None else {}
+
+    started = time.perf_counter()
+    chunks = 0
+    for content in answer_flights.stream(
+        _answer_key(retriever, question), lambda: _stream_answer(retriever, question)
+    ):
+        if chunks == 0:
+            metrics["time_to_first_token"] = time.perf_counter() - started
+        chunks += 1
+        yield content
+
+    metrics["total_time"] = time.perf_counter() - started
+    metrics["chunks"] = chunks
+    if "time_to_first_token" in metrics:
+        record("answer.first_token", metrics["time_to_first_token"])
+    record("answer.stream", metrics["total_time"])
+    logger.info(
+        "Answer generated: ttft=%.3fs total=%.3fs chunks=%d",
+        metrics.get("time_to_first_token", metrics["total_time"]),
+        metrics["total_time"],
+        chunks,
+    )
+
+
+def add_documents_to_collection(collection_name: str, documents):
     """
     Add documents to the vector database collection.
 
     Args:
-        vectordb: The vector database object to add documents to.
+        collection_name (str): The name of the collection to add documents to.
         documents: A list of documents to be added to the collection.
 
     This function splits the documents into smaller chunks, adds them to the
     vector database, and persists the changes.
     """
 
-    # Split the documents into smaller text chunks
-    texts = text_splitter.split_documents(documents)
+    # Split the documents into smaller text chunks and add them window by window
+    _add_in_windows(
+        collection_name,
+        iter_split_documents(documents),
+        content_hash=documents_hash(documents),
+    )
+
+    return load_collection(collection_name)
 
-    # Add the text chunks to the vector database
-    vectordb.add_documents(texts)
 
-    return vectordb
+def add_file_to_collection(
+    collection_name: str,
+    file_path: str,
+    window_size: int = 256,
+    content_hash: str = None,
+    progress=None,
+    name: str = None,
+    pdf_workers: int = None,
+) -> list[str]:
+    """
+    Stream a file into the vector database collection with bounded memory.
+
+    The file is loaded lazily, split as it is read, and embedded and upserted in
+    fixed-size windows of chunks, so for PDF, CSV and text files peak memory does
+    not grow with the file size (see lazy_load_document for the other types).
+    Content that was parsed before is read from the parse cache instead of the file.
+
+    Args:
+        collection_name (str): The name of the collection to add the chunks to.
+        file_path (str): Path to the document file; may be None for cached content.
+        window_size (int): Number of chunks embedded and upserted at a time.
+        content_hash (str, optional): Hash of the file. Computed if not given.
+        progress (callable, optional): Called with the number of chunks written so far
+                                       after every window.
+        name (str, optional): Display name stored in the parse cache.
+        pdf_workers (int, optional): Processes used to extract large PDFs,
+                                     defaults to PDF_WORKERS.
+
+    Returns:
+        list[str]: The ids of the chunks added.
+    """
+    content_hash = content_hash or file_hash(file_path)
+    pages = iter_parsed_document(file_path, content_hash, name=name, pdf_workers=pdf_workers)
+    chunks = iter_split_documents(pages)
+    return _add_in_windows(collection_name, chunks, content_hash, window_size, progress)
+
+
+def file_hash(file_path: str) -> str:
+    """
+    Return the hex SHA-256 digest of a file's contents.
+
+    Args:
+        file_path (str): Path to the file.
+
+    Returns:
+        str: The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def documents_hash(documents: list[Document]) -> str:
+    """
+    Return a content hash for a list of in-memory documents.
+
+    Args:
+        documents (list[Document]): The documents to hash.
+
+    Returns:
+        str: The hex digest of their combined page contents.
+    """
+    return text_hash("\x00".join(document.page_content for document in documents))
+
+
+def chunk_id(content_hash: str, text: str) -> str:
+    """
+    Return the deterministic id of a chunk, derived from its source and its text.
+
+    Re-ingesting the same source therefore upserts the same ids instead of adding
+    duplicate chunks.
+
+    Args:
+        content_hash (str): Hash of the source the chunk comes from.
+        text (str): The chunk text.
+
+    Returns:
+        str: The chunk id.
+    """
+    return text_hash(f"{content_hash}:{text_hash(text)}")
+
+
+def _add_in_windows(
+    collection_name: str,
+    chunks: Iterable[Document],
+    content_hash: str,
+    window_size: int = 256,
+    progress=None,
+) -> list[str]:
+    # Embed and upsert chunks a window at a time so memory stays bounded
+    chunks = iter(chunks)
+    chunk_ids = {}
+    while True:
+        window = list(islice(chunks, window_size))
+        if not window:
+            break
+        # Identical chunks of one source share an id, so only upsert each once
+        unique = {}
+        for chunk in window:
+            chunk.metadata["content_hash"] = content_hash
+            unique.setdefault(chunk_id(content_hash, chunk.page_content), chunk)
+        # Embed outside the write lock so other writers only wait for the upsert
+        documents = list(unique.values())
+        embeddings = get_embeddings().embed_documents(
+            [chunk.page_content for chunk in documents]
+        )
+        with span("vector_upsert"), vector_write():
+            if collection_name == CORPUS_COLLECTION:
+                _record_corpus_embedding_model()
+            raw_collection(collection_name).upsert(
+                ids=list(unique.keys()),
+                embeddings=embeddings,
+                documents=[chunk.page_content for chunk in documents],
+                metadatas=[chunk.metadata for chunk in documents],
+            )
+            # Index the same chunks for BM25 search
+            add_chunks(
+                collection_name,
+                [(cid, content_hash, chunk.page_content) for cid, chunk in unique.items()],
+            )
+        chunk_ids.update(dict.fromkeys(unique))
+        if progress:
+            progress(len(chunk_ids))
+
+    if chunk_ids:
+        # The collection's corpus changed, so its cached answers are stale
+        get_answer_cache().invalidate(collection_name)
+    return list(chunk_ids)
+
+
+@timed("ingest.source")
+def add_source(
+    chat_id,
+    name: str,
+    source_type: str = "document",
+    file_path: str = None,
+    documents=None,
+    progress=None,
+    content_hash: str = None,
+    pdf_workers: int = None,
+):
+    """
+    Add a file or a list of documents to a chat as a source.
+
+    Ingestion is idempotent: if the chat already has a source with the same content,
+    nothing is embedded again and the existing source id is returned. Content that
+    any chat already added is attached by recording the source row only; new content
+    is parsed, embedded and stored once in the shared corpus, and its chunk ids are
+    recorded so the vectors can be removed with the last source that uses them.
+    The extracted text is kept in the parse cache, so content that was parsed before
+    can be added by its hash alone, without the file.
+
+    Args:
+        chat_id (int): The chat to add the source to.
+        name (str): Display name of the source (file name or URL).
+        source_type (str): "document" or "link".
+        file_path (str, optional): Path of a file to stream into the collection.
+        documents (list[Document], optional): Documents to add when there is no file.
+        progress (callable, optional): Called with the number of chunks written so far.
+        content_hash (str, optional): Hash of the content, for a file already hashed
+                                      or already in the parse cache.
+        pdf_workers (int, optional): Processes used to extract a large PDF file,
+                                     defaults to PDF_WORKERS.
+
+    Returns:
+        int: The id of the source row.
+
+    Raises:
+        ValueError: If the chat was deleted while its source was being added.
+    """
+    if content_hash is None:
+        content_hash = file_hash(file_path) if file_path else documents_hash(documents)
+    existing = find_source(chat_id, content_hash)
+    if existing:
+        return existing[0]
+
+    collection_name = f"chat_{chat_id}"
+    chunk_ids = list_document_chunks(content_hash)
+    if chunk_ids:
+        # Already in the corpus through another chat
+        if progress:
+            progress(len(chunk_ids))
+        with transaction():
+            _check_chat_exists(chat_id)
+            source_id = create_source(
+                name, "", chat_id, source_type=source_type, content_hash=content_hash
+            )
+    else:
+        try:
+            if documents is None:
+                chunk_ids = add_file_to_collection(
+                    CORPUS_COLLECTION,
+                    file_path,
+                    content_hash=content_hash,
+                    progress=progress,
+                    name=name,
+                    pdf_workers=pdf_workers,
+                )
+            else:
+                store_parsed_document(content_hash, name, documents)
+                chunk_ids = _add_in_windows(
+                    CORPUS_COLLECTION,
+                    iter_split_documents(documents),
+                    content_hash=content_hash,
+                    progress=progress,
+                )
+            with transaction():
+                _check_chat_exists(chat_id)
+                source_id = create_source(
+                    name, "", chat_id, source_type=source_type, content_hash=content_hash
+                )
+                add_document_chunks(content_hash, chunk_ids)
+        except BaseException:
+            # Failed or cancelled part-way; re-running re-embeds from the embedding cache
+            _discard_partial_content(content_hash)
+            raise
+    invalidate_collection(collection_name)
+    return source_id
+
+
+def _check_chat_exists(chat_id):
+    # Checked in the transaction that records the source, so a chat deleted while its
+    # source was being ingested never gets an orphan source row
+    if read_chat(chat_id) is None:
+        raise ValueError(f"Chat {chat_id} no longer exists")
+
+
+def remove_source(source_id):
+    """
+    Delete a source and remove its chunks from the shared corpus.
+
+    Chunks are kept while any source, in any chat, has identical content.
+
+    Args:
+        source_id (int): The id of the source to delete.
+    """
+    source = read_source(source_id)
+    if not source:
+        return
+    chat_id, content_hash = source[4], source[5]
+
+    delete_source(source_id)
+    if content_hash:
+        _delete_unreferenced_content(content_hash)
+    delete_orphan_document_chunks()
+    invalidate_collection(f"chat_{chat_id}")
+
+
+def _delete_unreferenced_content(content_hash):
+    # Drop a source's chunks from the corpus once no source refers to its content
+    if find_source(None, content_hash):
+        return
+    chunk_ids = list_document_chunks(content_hash)
+    with vector_write():
+        if chunk_ids:
+            raw_collection(CORPUS_COLLECTION).delete(ids=chunk_ids)
+        delete_chunks(CORPUS_COLLECTION, content_hash)
+
+
+def _discard_partial_content(content_hash):
+    # Undo the chunks an interrupted ingest already wrote: without a source or a
+    # document_chunks row nothing else would ever delete them
+    if find_source(None, content_hash) or list_document_chunks(content_hash):
+        return
+    with vector_write():
+        corpus = raw_collection(CORPUS_COLLECTION)
+        chunk_ids = corpus.get(where={"content_hash": content_hash}, include=[])["ids"]
+        if chunk_ids:
+            corpus.delete(ids=chunk_ids)
+        delete_chunks(CORPUS_COLLECTION, content_hash)
+
+
+def rechunk_document(content_hash: str, progress=None):
+    """
+    Re-split and re-embed a document in the shared corpus from its stored text.
+
+    Uses the current splitter settings and embedding model, so neither the original
+    file nor a re-upload is needed. The new chunks are added next to the old ones,
+    and the chunks that no longer exist are removed from the vector store and the
+    lexical index in one step, so searches never see the document missing.
+
+    Args:
+        content_hash (str): Hash of the document's content.
+        progress (callable, optional): Called with the number of chunks written so far.
+
+    Returns:
+        dict | None: `added` and `removed` chunk counts, or None if no text is stored.
+    """
+    documents = load_parsed_document(content_hash)
+    if documents is None:
+        return None
+
+    old_ids = set(list_document_chunks(content_hash))
+    # Identical chunks keep their ids, so they are upserted and keep their lexical rows
+    chunk_ids = _add_in_windows(
+        CORPUS_COLLECTION,
+        iter_split_documents(documents),
+        content_hash,
+        progress=progress,
+    )
+    stale = list(old_ids - set(chunk_ids))
+    with vector_write(), transaction():
+        if stale:
+            raw_collection(CORPUS_COLLECTION).delete(ids=stale)
+            delete_chunk_ids(CORPUS_COLLECTION, stale)
+        set_document_chunks(content_hash, chunk_ids)
+    # Answers of the chats using this document were built from the old chunks
+    for source_chat_id in list_chats_with_content(content_hash):
+        get_answer_cache().invalidate(f"chat_{source_chat_id}")
+    invalidate_collection(CORPUS_COLLECTION)
+    return {"added": len(set(chunk_ids) - old_ids), "removed": len(stale)}
+
+
+def remove_chat(chat_id):
+    """
+    Delete a chat with its messages and sources, cancel its ingestion jobs, and drop
+    the corpus chunks no other chat uses.
+
+    Args:
+        chat_id (int): The id of the chat to delete.
+    """
+    collection_name = f"chat_{chat_id}"
+    # Queued uploads are discarded now; running jobs stop at their next progress report
+    for job in list_jobs(chat_id):
+        cancel(job[0])
+    content_hashes = {source[5] for source in list_sources(chat_id) if source[5]}
+    delete_chat(chat_id)
+    for content_hash in content_hashes:
+        _delete_unreferenced_content(content_hash)
+
+    # Chats created before the shared corpus have a collection of their own
+    _drop_collection(collection_name)
+    delete_orphan_document_chunks()
+
+
+def _drop_collection(collection_name):
+    with vector_write():
+        delete_chunks(collection_name)
+        invalidate_collection(collection_name)
+        if VECTOR_BACKEND == "matrix":
+            from matrix_store import delete_matrix_collection
+
+            delete_matrix_collection(PERSIST_DIRECTORY, collection_name)
+        else:
+            try:
+                get_client().delete_collection(collection_name)
+            except ValueError:
+                # The collection does not exist
+                pass
+
+
+def migrate_to_corpus(collection_name, batch_size: int = 1000) -> dict:
+    """
+    Move the chunks of a per-chat collection into the shared corpus.
+
+    Vectors are copied without re-embedding them, and chunks already in the corpus
+    are merged by id. The old collection is dropped afterwards, unless it holds
+    chunks ingested before content hashes were recorded; those cannot be attributed
+    to a source, so the collection is kept and its sources should be re-added.
+
+    Args:
+        collection_name (str): The `chat_{id}` collection to migrate.
+        batch_size (int): Number of vectors copied at a time.
+
+    Returns:
+        dict: The number of chunks moved and skipped, and whether the old
+            collection was dropped.
+    """
+    moved = skipped = 0
+    offset = 0
+    while True:
+        # Fetched per batch, since another process's write makes us reopen the client
+        batch = raw_collection(collection_name).get(
+            include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset
+        )
+        if not batch["ids"]:
+            break
+        offset += len(batch["ids"])
+
+        selected = [
+            i
+            for i, metadata in enumerate(batch["metadatas"])
+            if (metadata or {}).get("content_hash")
+        ]
+        skipped += len(batch["ids"]) - len(selected)
+        if not selected:
+            continue
+        chunks = [
+            (batch["ids"][i], batch["metadatas"][i]["content_hash"], batch["documents"][i])
+            for i in selected
+        ]
+        by_hash = {}
+        for cid, content_hash, _ in chunks:
+            by_hash.setdefault(content_hash, []).append(cid)
+        with vector_write():
+            raw_collection(CORPUS_COLLECTION).upsert(
+                ids=[batch["ids"][i] for i in selected],
+                embeddings=[batch["embeddings"][i] for i in selected],
+                documents=[batch["documents"][i] for i in selected],
+                metadatas=[batch["metadatas"][i] for i in selected],
+            )
+            with transaction():
+                add_chunks(CORPUS_COLLECTION, chunks)
+                for content_hash, chunk_ids in by_hash.items():
+                    add_document_chunks(content_hash, chunk_ids)
+        moved += len(selected)
+
+    dropped = not skipped
+    if dropped:
+        _drop_collection(collection_name)
+    invalidate_collection(CORPUS_COLLECTION)
+    return {"moved": moved, "skipped": skipped, "dropped": dropped}
+
+
+def compact_collection(collection_name, batch_size: int = 1000) -> dict:
+    """
+    Rebuild a collection without the chunks of deleted sources.
+
+    Chroma does not shrink its HNSW index when vectors are deleted, so this copies
+    the live vectors (without re-embedding them) into a fresh collection and swaps
+    it in place of the old one. Matrix collections rewrite their matrix file instead.
+    Chunks whose `content_hash` no longer belongs to any source (of the chat, for a
+    `chat_{id}` collection) are dropped, from the lexical index too; chunks ingested
+    before hashes were recorded are kept.
+
+    Writers wait on vector_write until the rebuild is done, and a compaction that
+    was interrupted is finished on the next load or compaction. Don't run it
+    alongside bulk_ingest, whose files have no source until they are flushed.
+
+    Args:
+        collection_name (str): The corpus or a `chat_{id}` collection to compact.
+        batch_size (int): Number of vectors copied at a time.
+
+    Returns:
+        dict: The number of chunks kept and removed.
+    """
+    # Block writers for the whole rebuild so no chunk added meanwhile is lost
+    with vector_write():
+        if collection_name == CORPUS_COLLECTION:
+            # Queued and running jobs may have chunks before they have a source
+            live_hashes = list_content_hashes() | list_active_job_hashes()
+        else:
+            chat_id = collection_name.removeprefix("chat_")
+            live_hashes = {source[5] for source in list_sources(chat_id) if source[5]}
+
+        def keep(metadata):
+            return (
+                not (metadata or {}).get("content_hash")
+                or metadata["content_hash"] in live_hashes
+            )
+
+        # Drop the lexical rows of the same chunks
+        for content_hash in list_chunk_hashes(collection_name) - live_hashes:
+            delete_chunks(collection_name, content_hash)
+
+        if VECTOR_BACKEND == "matrix":
+            result = load_collection(collection_name).compact(keep)
+            invalidate_collection(collection_name)
+            return result
+
+        client = get_client()
+        _recover_compaction(client, collection_name)
+        old = client.get_collection(collection_name)
+        # Built under a separate name and swapped in at the end; see _recover_compaction
+        new = client.create_collection(
+            f"{collection_name}_compact", metadata=old.metadata or None
+        )
+        kept = removed = 0
+        offset = 0
+        while True:
+            batch = old.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=batch_size,
+                offset=offset,
+            )
+            if not batch["ids"]:
+                break
+            offset += len(batch["ids"])
+
+            selected = [i for i, metadata in enumerate(batch["metadatas"]) if keep(metadata)]
+            removed += len(batch["ids"]) - len(selected)
+            kept += len(selected)
+            if selected:
+                new.add(
+                    ids=[batch["ids"][i] for i in selected],
+                    embeddings=[batch["embeddings"][i] for i in selected],
+                    documents=[batch["documents"][i] for i in selected],
+                    metadatas=[batch["metadatas"][i] for i in selected],
+                )
+
+        # Readers in this process keep using the old collection until the swap
+        with _handle_lock:
+            old.modify(name=f"{collection_name}_old")
+            new.modify(name=collection_name)
+            invalidate_collection(collection_name)
+        client.delete_collection(f"{collection_name}_old")
+
+    return {"kept": kept, "removed": removed}
+
+
+def _recover_compaction(client, collection_name):
+    """
+    Finish or undo a Chroma compaction of `collection_name` that was interrupted.
+
+    compact_collection copies the collection to `{name}_compact`, renames the
+    original to `{name}_old`, renames the copy to `{name}` and deletes `{name}_old`,
+    so whichever collections are left over tell how far it got. Call this while
+    holding vector_write.
+    """
+    names = {collection.name for collection in client.list_collections()}
+    old_name, compact_name = f"{collection_name}_old", f"{collection_name}_compact"
+    if old_name in names:
+        if collection_name not in names:
+            # Stopped between the two renames
+            if compact_name not in names:
+                client.get_collection(old_name).modify(name=collection_name)
+                return
+            client.get_collection(compact_name).modify(name=collection_name)
+            names.discard(compact_name)
+        client.delete_collection(old_name)
+    if compact_name in names:
+        # A copy that was never swapped in
+        client.delete_collection(compact_name)
+
+
+def reindex_lexical(collection_name, batch_size: int = 1000) -> int:
+    """
+    Rebuild the BM25 chunk index of a collection from the chunks in the vector store.
+
+    Use this to backfill collections that were ingested before lexical indexing
+    existed.
+
+    Args:
+        collection_name (str): The collection to reindex.
+        batch_size (int): Number of chunks read at a time.
+
+    Returns:
+        int: The number of chunks indexed.
+    """
+    collection = raw_collection(collection_name)
+    delete_chunks(collection_name)
+    offset = 0
+    while True:
+        batch = collection.get(
+            include=["documents", "metadatas"], limit=batch_size, offset=offset
+        )
+        if not batch["ids"]:
+            break
+        offset += len(batch["ids"])
+        add_chunks(
+            collection_name,
+            [
+                (cid, (metadata or {}).get("content_hash"), document)
+                for cid, document, metadata in zip(
+                    batch["ids"], batch["documents"], batch["metadatas"]
+                )
+            ],
+        )
+    return offset
+
+
+_startup_timings["import"] = time.perf_counter() - _import_started